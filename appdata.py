@@ -0,0 +1,10 @@
+import os
+
+APP_NAME = "HaokeeNoteGetter"
+
+def data_dir(*parts):
+    """Returns a per-user folder for caches and saved state, creating it if needed."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, APP_NAME, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
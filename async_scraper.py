@@ -0,0 +1,161 @@
+import asyncio
+import threading
+
+import aiohttp
+
+from scraper import BaseScraper
+from mirror import in_prefix
+from transport import DEFAULT_HEADERS
+
+class AsyncHaokeeScraper(BaseScraper):
+    """asyncio counterpart of HaokeeScraper: same methods, but they are coroutines."""
+
+    def __init__(self, concurrency=32, pool_size=32, timeout=30, headers=None):
+        super().__init__()
+        self.concurrency = max(1, concurrency)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        # Created lazily so the session and semaphore belong to the running loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _fetch(self, url, as_text=True, timeout=None):
+        session = self._get_session()
+        # Bounds the fan-out: thousands of tasks may be waiting, only `concurrency` are on the wire
+        async with self._semaphore:
+            async with session.get(url, timeout=timeout) as resp:
+                resp.raise_for_status()
+                if as_text:
+                    return await resp.text(encoding=resp.charset or 'utf-8', errors='replace')
+                return await resp.read()
+
+    async def get_site_info(self):
+        """Fetches the home page and extracts siteInfo."""
+        print(f"Fetching site info from {self.base_url}...")
+        try:
+            html = await self._fetch(self.base_url)
+            return self.parse_site_info(html)
+        except Exception as e:
+            print(f"Error getting site info: {e}")
+            raise
+
+    async def get_directory(self):
+        """Fetches the directory structure (cache)."""
+        if not self.site_info:
+            await self.get_site_info()
+
+        cache_url = self.cache_url()
+
+        print(f"Fetching directory from {cache_url}...")
+        try:
+            session = self._get_session()
+            async with self._semaphore:
+                async with session.get(cache_url) as resp:
+                    resp.raise_for_status()
+                    cache_data = await resp.json(content_type=None)
+            return self.load_directory(cache_data)
+        except Exception as e:
+            print(f"Error fetching directory: {e}")
+            raise
+
+    async def get_page_content(self, path):
+        """Fetches the markdown content of a page. Raises on failure, like HaokeeScraper."""
+        if not self.site_info:
+            await self.get_site_info()
+
+        content_url = self.construct_url(path)
+
+        try:
+            return await self._fetch(content_url)
+        except Exception as e:
+            print(f"Error fetching content: {e}")
+            raise
+
+    async def get_media_bytes(self, full_path):
+        """Fetches the raw bytes of a media file."""
+        # A large video may take minutes in total; only a stalled connection should time out
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        return await self._fetch(self.construct_url(full_path), as_text=False, timeout=timeout)
+
+    async def get_many(self, paths):
+        """Fetches many pages concurrently; returns {path: content or None}, None where the fetch failed."""
+        paths = list(paths)
+        contents = await asyncio.gather(*(self.get_page_content(p) for p in paths), return_exceptions=True)
+        for content in contents:
+            if isinstance(content, BaseException) and not isinstance(content, Exception):
+                raise content # Cancellation, not a failed page
+        return {path: None if isinstance(content, Exception) else content
+                for path, content in zip(paths, contents)}
+
+    async def crawl(self, prefix=""):
+        """Fetches every note under prefix and the media each one references."""
+        if self.cache_data is None:
+            await self.get_directory()
+
+        notes = [p for p in self.cache_data if p.endswith('.md') and in_prefix(p, prefix)]
+        pages = await self.get_many(notes)
+        return {path: {'content': content, 'media': self.extract_media(content, path)}
+                for path, content in pages.items()}
+
+class EventLoopThread:
+    """
+    Runs an asyncio loop on a daemon thread so blocking code (headless jobs, Qt slots)
+    can submit coroutines without owning a loop. submit() returns a concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="asyncio-loop", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+if __name__ == "__main__":
+    # Test: crawl the whole vault from a single thread
+    async def main():
+        async with AsyncHaokeeScraper(concurrency=32) as scraper:
+            await scraper.get_directory()
+            pages = await scraper.crawl()
+            fetched = sum(1 for page in pages.values() if page['content'] is not None)
+            media = sum(len(page['media']) for page in pages.values())
+            print(f"Fetched {fetched}/{len(pages)} notes, {media} media references.")
+
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: single-pass media_extractor vs. the previous two-regex extract_media.
+
+    python benchmarks/bench_extract_media.py [--repeat 20] [--size 2000]
+
+Builds a large synthetic note (wiki embeds with |size and #anchor suffixes,
+standard image links, HTML media tags, repeated embeds and plain prose),
+resolves links against the directory snapshot in cache_debug.json and reports
+the time per note plus how many media entries each implementation returns.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from media_extractor import extract_links
+from resolver import LinkResolver
+
+def legacy_extract(content, resolve):
+    """The extract_media loop as it was before media_extractor (URL construction left out of both sides)."""
+    if not content:
+        return []
+    media_files = []
+    wiki_links = re.findall(r'!\[\[(.*?)\]\]', content)
+    for link in wiki_links:
+        filename = link.split('|')[0]
+        full_path = resolve(filename)
+        if full_path:
+            media_files.append({'name': filename, 'path': full_path})
+    md_links = re.findall(r'!\[.*?\]\((.*?)\)', content)
+    for link in md_links:
+        if link.startswith('http'):
+            pass
+        else:
+            from urllib.parse import unquote
+            filename = unquote(link.split('/')[-1])
+            full_path = resolve(filename)
+            if full_path:
+                media_files.append({'name': filename, 'path': full_path})
+    return media_files
+
+def current_extract(content, resolve):
+    media_files = []
+    seen = set()
+    for link in extract_links(content):
+        full_path = resolve(link)
+        if full_path and not full_path.endswith('.md') and full_path not in seen:
+            seen.add(full_path)
+            media_files.append({'name': full_path.split('/')[-1], 'path': full_path})
+    return media_files
+
+def build_note(media_names, sections):
+    prose = "这是一段用于测试的正文，包含 `inline code` 与 [[普通链接]]，以及 [外部链接](https://example.com)。\n"
+    blocks = []
+    for i in range(sections):
+        name = media_names[i % len(media_names)]
+        blocks.append(f"## 第 {i} 节\n")
+        blocks.append(prose * 3)
+        blocks.append(f"![[{name}]]\n")
+        blocks.append(f"![[{name}|300]]\n")
+        blocks.append(f"![[{name}#pic_center]]\n")
+        blocks.append(f"![图](file/{name.replace(' ', '%20')})\n")
+        blocks.append(f'<img src="file/{name}" width="200">\n')
+    return ''.join(blocks)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--size', type=int, default=2000, help="sections in the synthetic note")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'cache_debug.json'), 'r', encoding='utf-8') as f:
+        cache_data = json.load(f)
+    resolver = LinkResolver(cache_data.keys())
+    media_names = sorted(p.split('/')[-1] for p in cache_data if p.startswith('file/'))
+    note = build_note(media_names, args.size)
+
+    legacy_resolve = lambda link: resolver.resolve(link)
+    for name, func in [('legacy (2 x re.findall)', legacy_extract), ('media_extractor', current_extract)]:
+        seconds = min(timeit.repeat(lambda: func(note, legacy_resolve), number=1, repeat=args.repeat))
+        count = len(func(note, legacy_resolve))
+        print(f"{name:<26} {seconds * 1000:8.2f} ms/note  {count:6d} entries  ({len(note) // 1024} KiB note)")
+
+if __name__ == "__main__":
+    main()
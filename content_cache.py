@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from appdata import data_dir
+
+class ContentCache:
+    """
+    Disk-backed cache of note bodies keyed by vault path.
+    Keeps ETag / Last-Modified so entries can be revalidated with a conditional GET,
+    and evicts least recently used entries once the total size exceeds max_bytes.
+    The index is written at most every save_interval seconds (and by flush()), never
+    while holding the lock that lookups need.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=64 * 1024 * 1024, save_interval=5.0):
+        self.cache_dir = cache_dir or data_dir("content")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # Serializes index writes, which happen outside _lock
+        self._index = self._load_index()
+        self._total = sum(entry['size'] for entry in self._index.values())
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _snapshot_locked(self):
+        self._dirty = False
+        self._last_save = time.monotonic()
+        return json.dumps(self._index, ensure_ascii=False)
+
+    def _write_index(self, data):
+        with self._save_lock:
+            tmp = self.index_path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self.index_path)
+
+    def _file_for(self, path):
+        return os.path.join(self.cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+    def conditional_headers(self, path):
+        """Headers that let the server answer 304 if our copy is still current."""
+        with self._lock:
+            entry = self._index.get(path)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if headers:
+            with self._lock:
+                self.revalidations += 1
+        return headers
+
+    def _read_locked(self, path):
+        if not self._index.get(path):
+            return None
+        try:
+            with open(self._file_for(path), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            # Body file vanished; forget the entry
+            self._total -= self._index.pop(path)['size']
+            self._dirty = True
+            return None
+
+    def get(self, path):
+        """Returns the cached body for path, or None. Counts as a hit."""
+        with self._lock:
+            body = self._read_locked(path)
+            if body is not None:
+                self._index[path]['atime'] = time.time()
+                self.hits += 1
+            return body
+
+    def peek(self, path):
+        """Like get(), but neither counts as a hit nor refreshes the entry's LRU position."""
+        with self._lock:
+            return self._read_locked(path)
+
+    def put(self, path, body, etag=None, last_modified=None):
+        data = body.encode('utf-8')
+        # Write the body first, so a reader under the lock never sees a half-written file
+        target = self._file_for(path)
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+        snapshot = None
+        with self._lock:
+            self.misses += 1
+            old = self._index.get(path)
+            if old:
+                self._total -= old['size']
+            self._index[path] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'size': len(data),
+                'atime': time.time(),
+            }
+            self._total += len(data)
+            victims = self._evict_locked()
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.save_interval:
+                snapshot = self._snapshot_locked()
+
+        for victim in victims:
+            try:
+                os.remove(self._file_for(victim))
+            except OSError:
+                pass
+        if snapshot is not None:
+            self._write_index(snapshot)
+
+    def _evict_locked(self):
+        """Drops least recently used entries from the index; returns their paths for the caller to delete."""
+        if self._total <= self.max_bytes:
+            return []
+        # Go a little below the limit, so the next puts don't each sort the whole index again
+        goal = self.max_bytes * 0.9
+        victims = []
+        for path, entry in sorted(self._index.items(), key=lambda kv: kv[1]['atime']):
+            if self._total <= goal:
+                break
+            self._total -= entry['size']
+            del self._index[path]
+            victims.append(path)
+        return victims
+
+    def flush(self):
+        """Persists the index, including access times gathered by get()."""
+        with self._lock:
+            snapshot = self._snapshot_locked()
+        self._write_index(snapshot)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'bytes': self._total,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+            }
+
+class MemoryCache:
+    """
+    Small in-memory LRU of recently read or prefetched note bodies, bounded by max_bytes.
+    Entries younger than max_age seconds are served without asking the server at all.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_age=300):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self._entries = OrderedDict() # path -> (body, size, stored at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            return entry is not None and time.time() - entry[2] < self.max_age
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if time.time() - entry[2] >= self.max_age:
+                self._drop(path)
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, path, body):
+        size = len(body.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(path)
+            self._entries[path] = (body, size, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits}
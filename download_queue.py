@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+import time
+
+from appdata import data_dir
+from downloader import DownloadEngine, target_path
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+UNFINISHED = (QUEUED, RUNNING, PAUSED)
+
+def _item_key(item, dest_folder):
+    # Different spellings of one folder (trailing slash, separators, case on Windows) compare equal
+    return item['url'], os.path.normcase(os.path.abspath(target_path(item, dest_folder)))
+
+class DownloadQueue:
+    """
+    Persistent, prioritized queue of download jobs, worked through one job at a time by run().
+
+    A job is a batch of items for one destination folder. Finished URLs are recorded as
+    they complete and the queue is saved to disk, so a job interrupted by pause, cancel or
+    an app exit continues where it stopped on the next run (half-downloaded files resume
+    from their .part files). Jobs left running or queued at exit start again on launch.
+    """
+
+    def __init__(self, transport, path=None, concurrency=8, per_host=4, max_rate=None, per_host_rate=None):
+        self.transport = transport
+        self.path = path or os.path.join(data_dir(), "download_queue.json")
+        self.concurrency = concurrency
+        self.per_host = per_host
+        # Bandwidth caps in bytes per second (None = unlimited); saved with the queue
+        self.max_rate = max_rate
+        self.per_host_rate = per_host_rate
+        self.paused = False
+        self._jobs = []
+        self._next_id = 1
+        self._engine = None # Engine of the running job
+        self._stopped = False
+        self._last_save = 0.0
+        self._cond = threading.Condition()
+        self.load()
+
+    # --- Persistence ---
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            jobs = data['jobs']
+        except (OSError, ValueError, KeyError):
+            return
+        limits = data.get('limits') or {}
+        with self._cond:
+            self.max_rate = limits.get('max_rate', self.max_rate)
+            self.per_host_rate = limits.get('per_host_rate', self.per_host_rate)
+            for job in jobs:
+                job['done'] = set(job['done'])
+                if job['state'] == RUNNING:
+                    # The app exited mid-job
+                    job['state'] = QUEUED
+            self._jobs = jobs
+            self._next_id = max([job['id'] for job in jobs], default=0) + 1
+
+    def _save_locked(self):
+        data = {
+            'jobs': [dict(job, done=sorted(job['done'])) for job in self._jobs],
+            'limits': {'max_rate': self.max_rate, 'per_host_rate': self.per_host_rate},
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._last_save = time.monotonic()
+
+    def save(self):
+        with self._cond:
+            self._save_locked()
+
+    # --- Jobs ---
+
+    def _job(self, job_id):
+        for job in self._jobs:
+            if job['id'] == job_id:
+                return job
+        return None
+
+    def add(self, items, dest_folder, name, priority=0):
+        """
+        Queues items for dest_folder. Items an unfinished job is already downloading to the
+        same file are dropped; the same URL into another folder is queued again.
+        Returns the new job, or None if nothing was left to download.
+        """
+        with self._cond:
+            pending = set() # (url, local file)
+            for job in self._jobs:
+                if job['state'] in UNFINISHED:
+                    pending.update(_item_key(item, job['dest']) for item in job['items']
+                                   if item['url'] not in job['done'])
+            fresh = []
+            for item in items:
+                key = _item_key(item, dest_folder)
+                if key not in pending:
+                    pending.add(key)
+                    fresh.append(dict(item))
+            if not fresh:
+                return None
+
+            job = {
+                'id': self._next_id,
+                'name': name,
+                'dest': dest_folder,
+                'priority': priority,
+                'state': QUEUED,
+                'items': fresh,
+                'done': set(),
+                'failed': {}, # url -> error
+                'created': time.time(),
+            }
+            self._next_id += 1
+            self._jobs.append(job)
+            self._save_locked()
+            self._cond.notify_all()
+            return job
+
+    def jobs(self):
+        """Snapshot of every job with progress counts, highest priority first, for display."""
+        with self._cond:
+            snapshot = []
+            for job in sorted(self._jobs, key=self._order):
+                snapshot.append({
+                    'id': job['id'],
+                    'name': job['name'],
+                    'dest': job['dest'],
+                    'priority': job['priority'],
+                    'state': job['state'],
+                    'total': len(job['items']),
+                    'done': len(job['done']),
+                    'failed': len(job['failed']),
+                })
+            return snapshot
+
+    def has_unfinished(self):
+        with self._cond:
+            return any(job['state'] in UNFINISHED for job in self._jobs)
+
+    @staticmethod
+    def _order(job):
+        return (-job['priority'], job['id'])
+
+    def pause(self, job_id):
+        with self._cond:
+            job = self._job(job_id)
+            if job is None or job['state'] not in (QUEUED, RUNNING):
+                return
+            if job['state'] == RUNNING and self._engine is not None:
+                self._engine.cancel()
+            job['state'] = PAUSED
+            self._save_locked()
+
+    def resume(self, job_id):
+        """Re-queues a paused job, or retries the failed items of a failed one."""
+        with self._cond:
+            job = self._job(job_id)
+            if job is None or job['state'] not in (PAUSED, FAILED):
+                return
+            job['failed'] = {}
+            job['state'] = QUEUED
+            self._save_locked()
+            self._cond.notify_all()
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._job(job_id)
+            if job is None or job['state'] not in UNFINISHED:
+                return
+            if job['state'] == RUNNING and self._engine is not None:
+                self._engine.cancel()
+            job['state'] = CANCELLED
+            self._save_locked()
+
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            job = self._job(job_id)
+            if job is not None:
+                job['priority'] = priority
+                self._save_locked()
+
+    def set_rate_limits(self, max_rate=None, per_host_rate=None):
+        """Sets the bandwidth caps for every job, including the one running now."""
+        with self._cond:
+            self.max_rate = max_rate
+            self.per_host_rate = per_host_rate
+            if self._engine is not None:
+                self._engine.set_rate_limits(max_rate, per_host_rate)
+            self._save_locked()
+
+    def pause_all(self):
+        """Holds the whole queue; the running job stops and goes back to waiting."""
+        with self._cond:
+            self.paused = True
+            if self._engine is not None:
+                self._engine.cancel()
+
+    def resume_all(self):
+        with self._cond:
+            self.paused = False
+            self._cond.notify_all()
+
+    def clear_finished(self):
+        with self._cond:
+            self._jobs = [job for job in self._jobs if job['state'] in UNFINISHED or job['state'] == FAILED]
+            self._save_locked()
+
+    def shutdown(self):
+        """Stops run(); the running job is saved as queued so it resumes on the next launch."""
+        with self._cond:
+            self._stopped = True
+            if self._engine is not None:
+                self._engine.cancel()
+            self._cond.notify_all()
+
+    # --- Worker ---
+
+    def _next_job(self):
+        waiting = [job for job in self._jobs if job['state'] == QUEUED]
+        return min(waiting, key=self._order) if waiting else None
+
+    def run(self, on_change=None, on_progress=None, on_job_finished=None, before_job=None,
+            on_bytes=None, interval=0.1):
+        """
+        Works through the queue until shutdown(). Callbacks are invoked from this thread:
+        on_change(), on_progress(job, done, total, result), on_job_finished(job, results),
+        before_job(job, items) right before a job's items are downloaded. Engine worker
+        threads call on_bytes(job, snapshot) with byte progress, at most once per interval.
+        """
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopped:
+                    job = None if self.paused else self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job['state'] = RUNNING
+                items = [item for item in job['items'] if item['url'] not in job['done']]
+                # Probing sizes gives the byte progress an exact total early, so one large file
+                # queued after many small ones doesn't sit at an estimated 95%
+                engine = DownloadEngine(self.transport, concurrency=self.concurrency, per_host=self.per_host,
+                                        max_rate=self.max_rate, per_host_rate=self.per_host_rate,
+                                        probe_sizes=True)
+                self._engine = engine
+                self._save_locked()
+            if on_change:
+                on_change()
+            if before_job:
+                before_job(job, items)
+
+            def progress(done, total, result):
+                with self._cond:
+                    if result['ok']:
+                        job['done'].add(result['url'])
+                        job['failed'].pop(result['url'], None)
+                    elif not result['cancelled']:
+                        job['failed'][result['url']] = result['error']
+                    # Frequent enough that little is redone after a crash, without rewriting the file per item
+                    if time.monotonic() - self._last_save > 2:
+                        self._save_locked()
+                if on_progress:
+                    on_progress(job, done, total, result)
+
+            try:
+                bytes_callback = (lambda snapshot: on_bytes(job, snapshot)) if on_bytes else None
+                results = engine.run(items, job['dest'], progress, bytes_callback, interval)
+            except Exception as e:
+                print(f"Download job {job['name']} failed: {e}")
+                results = []
+                with self._cond:
+                    job['failed']['*'] = str(e)
+
+            with self._cond:
+                self._engine = None
+                if job['state'] == RUNNING:
+                    if self._stopped or self.paused:
+                        job['state'] = QUEUED # Interrupted, not finished
+                    else:
+                        job['state'] = FAILED if job['failed'] else DONE
+                self._save_locked()
+                finished = job['state'] in (DONE, FAILED)
+            if on_change:
+                on_change()
+            if finished and on_job_finished:
+                on_job_finished(job, results)
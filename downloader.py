@@ -0,0 +1,363 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from manifest import DownloadManifest, file_digest
+from throttle import TokenBucket, AdaptiveLimiter, is_congestion
+from retry import CircuitOpen
+from progress import TransferProgress
+
+class DownloadCancelled(Exception):
+    pass
+
+def target_path(item, dest_folder):
+    """Where item lands: its optional vault-style 'target' ("folder/file.png") or just its name."""
+    relative = item.get('target', item['name'])
+    return os.path.join(dest_folder, *relative.split('/'))
+
+def save_part_meta(part, meta):
+    """Writes the sidecar that lets a later transfer resume part safely (url + validators)."""
+    with open(part + ".json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+class DownloadEngine:
+    """
+    Downloads a batch of media items with a pool of worker threads.
+
+    concurrency is the most transfers ever in flight; per_host is where each host's
+    limit starts before it adapts (see AdaptiveLimiter). max_rate / per_host_rate cap
+    bandwidth in bytes per second (None = unlimited). probe_sizes sends a HEAD, alongside
+    the transfers, for items not yet started, so byte progress gets an exact total early.
+    """
+
+    def __init__(self, transport, concurrency=4, per_host=4, chunk_size=64 * 1024, resume_attempts=3,
+                 use_manifest=True, check_remote=False, max_rate=None, per_host_rate=None,
+                 probe_sizes=False):
+        self.transport = transport
+        self.resume_attempts = resume_attempts
+        # Skip files the destination manifest says are already up to date;
+        # check_remote additionally confirms with a HEAD request.
+        self.use_manifest = use_manifest
+        self.check_remote = check_remote
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.chunk_size = chunk_size
+        self.per_host_rate = per_host_rate
+        self._bandwidth = TokenBucket(max_rate)
+        self._hosts = {} # host -> (AdaptiveLimiter, TokenBucket)
+        self._host_lock = threading.Lock()
+        self._cancel = threading.Event()
+        self.probe_sizes = probe_sizes
+        self.progress = TransferProgress() # Byte-level progress of the current / last run
+        self._on_bytes = None
+        self._bytes_interval = 0.1
+
+    def cancel(self):
+        self._cancel.set()
+
+    def set_rate_limits(self, max_rate=None, per_host_rate=None):
+        """Changes the bandwidth caps (bytes per second, None = unlimited), also mid-run."""
+        self._bandwidth.set_rate(max_rate)
+        with self._host_lock:
+            self.per_host_rate = per_host_rate
+            for _, bucket in self._hosts.values():
+                bucket.set_rate(per_host_rate)
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._hosts:
+                limiter = AdaptiveLimiter(self.per_host, maximum=self.concurrency)
+                self._hosts[host] = (limiter, TokenBucket(self.per_host_rate))
+            return self._hosts[host]
+
+    def _host_slot(self, url):
+        return self._host(url)[0].slot()
+
+    def _pace(self, url, amount):
+        """Called per chunk: yields to foreground fetches, then applies the bandwidth caps."""
+        # Not reading lets TCP slow the server down, leaving the link to the note being opened
+        while self.transport.has_foreground() and not self._cancel.is_set():
+            time.sleep(0.05)
+        limiter, bucket = self._host(url)
+        self._bandwidth.consume(amount)
+        bucket.consume(amount)
+        limiter.record(amount)
+
+    def run(self, items, dest_folder, progress_callback=None, bytes_callback=None, interval=0.1):
+        """
+        Downloads every item into dest_folder and returns one result dict per item.
+        progress_callback(done, total, result) is called from worker threads as each item finishes.
+        bytes_callback(snapshot) gets self.progress.snapshot() at most once per interval
+        seconds while data flows, and once more at the end.
+        cancel() takes effect even if it is called before run() starts.
+        """
+        # Two items writing the same file in parallel would corrupt it
+        unique = {}
+        for item in items:
+            unique.setdefault(target_path(item, dest_folder), item)
+
+        total = len(unique)
+        results = []
+        done_lock = threading.Lock()
+        manifest = DownloadManifest(dest_folder) if self.use_manifest else None
+        self.progress = TransferProgress(total)
+        self._on_bytes = bytes_callback
+        self._bytes_interval = interval
+
+        def worker(target, item):
+            result = self.download_one(item, target, manifest)
+            self.progress.finish_file(item['url'], item['name'], result['ok'], result['size'] or None)
+            self._report_bytes()
+            with done_lock:
+                results.append(result)
+                done = len(results)
+            if progress_callback:
+                progress_callback(done, total, result)
+            return result
+
+        to_probe = []
+        for target, item in unique.items():
+            entry = manifest.get(target) if manifest else None
+            if entry and manifest.is_current(target, item['url']):
+                # Likely skipped; its size is on record
+                self.progress.expect(item['url'], item['name'], entry['size'])
+            elif self.probe_sizes:
+                to_probe.append(item)
+
+        # Background jobs (prefetching) hold off while a download is running
+        with self.transport.bulk(), ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # Probes run alongside the transfers rather than before them, starting from the
+            # end of the batch, which the transfers reach last
+            probes = ThreadPoolExecutor(max_workers=min(4, self.concurrency)) if to_probe else None
+            if probes:
+                for item in reversed(to_probe):
+                    probes.submit(self._probe_size, item)
+            futures = [pool.submit(worker, target, item) for target, item in unique.items()]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                if probes:
+                    probes.shutdown(cancel_futures=True)
+                if manifest:
+                    manifest.save()
+                # Ready for the next batch
+                self._cancel.clear()
+
+        if bytes_callback:
+            bytes_callback(self.progress.snapshot())
+        self._on_bytes = None
+        return results
+
+    def _probe_size(self, item):
+        """HEAD request for the size of an item not started yet, so the batch total is exact early."""
+        if self._cancel.is_set() or not self.progress.waiting(item['url']):
+            return
+        try:
+            # No host slot: a HEAD is cheap, and holding a slot would delay the transfers
+            resp = self.transport.head(item['url'], headers={'Accept-Encoding': 'identity'},
+                                       on_congestion=self._host(item['url'])[0].congestion)
+            length = resp.headers.get('Content-Length')
+            if resp.ok and length and length.isdigit():
+                self.progress.expect(item['url'], item['name'], int(length))
+        except Exception as e:
+            print(f"Size probe failed for {item['name']}: {e}")
+
+    def _report_bytes(self, force=False):
+        if self._on_bytes and (force or self.progress.due(self._bytes_interval)):
+            self._on_bytes(self.progress.snapshot())
+
+    def download_one(self, item, target, manifest=None):
+        result = {
+            'name': item['name'],
+            'url': item['url'],
+            'path': target,
+            'ok': False,
+            'skipped': False,
+            'size': 0,
+            'resumed_from': 0,
+            'error': None,
+            'cancelled': False,
+        }
+        if self._cancel.is_set():
+            result['error'] = "已取消"
+            result['cancelled'] = True
+            return result
+
+        if manifest and self._is_up_to_date(item['url'], target, manifest):
+            result['ok'] = True
+            result['skipped'] = True
+            result['size'] = os.path.getsize(target)
+            return result
+
+        part = target + ".part"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        attempts = 0
+        while True:
+            try:
+                with self._host_slot(item['url']):
+                    self._transfer(item['url'], part, result)
+                # Only a complete file ever appears under the final name
+                os.replace(part, target)
+                self._remove_part_meta(part)
+                result['ok'] = True
+                if manifest:
+                    manifest.record(target, item['url'], result['size'], result['sha256'],
+                                    result.get('etag'), result.get('last_modified'))
+                return result
+            except DownloadCancelled as e:
+                result['error'] = str(e)
+                result['cancelled'] = True
+                return result
+            except Exception as e:
+                # Statuses were already reported by the transport; this catches timeouts mid-body
+                # (one congestion episode only lowers the limit once, so overlap is harmless)
+                if is_congestion(e):
+                    self._host(item['url'])[0].congestion()
+                attempts += 1
+                # A dropped connection keeps the .part file; pick up where it stopped.
+                # HTTP errors (404 and friends) carry a response and won't improve by retrying.
+                # A host behind an open circuit breaker is down: fail now rather than keep trying.
+                dropped = getattr(e, 'response', None) is None and not isinstance(e, CircuitOpen)
+                if dropped and attempts <= self.resume_attempts and os.path.exists(part):
+                    print(f"Resuming {item['name']} after error: {e}")
+                    time.sleep(self.transport.retry_policy.delay(attempts - 1))
+                    continue
+                print(f"Failed to download {item['name']}: {e}")
+                result['error'] = str(e)
+                return result
+
+    def _is_up_to_date(self, url, target, manifest):
+        if not manifest.is_current(target, url):
+            return False
+        if not self.check_remote:
+            return True
+        try:
+            with self._host_slot(url):
+                resp = self.transport.head(url, on_congestion=self._host(url)[0].congestion)
+            resp.raise_for_status()
+        except Exception as e:
+            # Can't confirm, so download again rather than keep a possibly stale file
+            print(f"HEAD check failed for {url}: {e}")
+            return False
+        return manifest.matches_remote(target, resp.headers)
+
+    def _transfer(self, url, part, result):
+        """Streams url into the .part file, continuing an earlier partial transfer when the server allows it."""
+        meta = self._load_part_meta(part)
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset and meta.get('url') != url:
+            # Partial data belongs to some other file
+            offset = 0
+
+        # Byte offsets must refer to the file itself, not a compressed encoding of it
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            # If-Range makes the server send the whole file if it changed since the partial transfer
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+
+        # Each 429 / 5xx / timeout lowers the host's limit right away, even if a retry then succeeds
+        with self.transport.get(url, stream=True, headers=headers,
+                                on_congestion=self._host(url)[0].congestion) as resp:
+            if resp.status_code == 416 and offset:
+                # Nothing left to fetch if the partial file already has every byte
+                total = _content_range_total(resp.headers.get('Content-Range'))
+                if total == offset:
+                    result['resumed_from'] = offset
+                    result['size'] = offset
+                    result['sha256'] = file_digest(part).hexdigest()
+                    result['etag'] = meta.get('etag')
+                    result['last_modified'] = meta.get('last_modified')
+                    return
+            else:
+                self._receive(url, part, resp, offset, result)
+                return
+
+        # Server file shrank or changed: drop the partial data and start over from byte 0
+        print(f"Range not satisfiable for {url}, restarting download")
+        os.remove(part)
+        self._remove_part_meta(part)
+        self._transfer(url, part, result)
+
+    def _receive(self, url, part, resp, offset, result):
+        """Writes the response body into the .part file (appending after offset for a 206)."""
+        resp.raise_for_status()
+
+        if resp.status_code == 206 and offset:
+            start = _content_range_start(resp.headers.get('Content-Range'))
+            if start != offset:
+                raise IOError(f"Server resumed at byte {start}, expected {offset}")
+            mode = 'ab'
+            result['resumed_from'] = offset
+            # Hash covers the whole file, so fold in the bytes we already have
+            digest = file_digest(part)
+        else:
+            # Server ignored the range (or there was none): full body
+            mode = 'wb'
+            offset = 0
+            digest = hashlib.sha256()
+
+        expected = resp.headers.get('Content-Length')
+        expected = offset + int(expected) if expected and expected.isdigit() else None
+
+        result['etag'] = resp.headers.get('ETag')
+        result['last_modified'] = resp.headers.get('Last-Modified')
+        self._save_part_meta(part, {
+            'url': url,
+            'etag': result['etag'],
+            'last_modified': result['last_modified'],
+        })
+
+        self.progress.start_file(url, result['name'], expected, offset)
+
+        written = offset
+        with open(part, mode) as f:
+            for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                if self._cancel.is_set():
+                    raise DownloadCancelled("已取消")
+                self._pace(url, len(chunk))
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                self.progress.advance(url, len(chunk))
+                self._report_bytes()
+        result['size'] = written
+        result['sha256'] = digest.hexdigest()
+
+        if expected is not None and written < expected:
+            raise IOError(f"Connection closed at {written} of {expected} bytes")
+
+    def _load_part_meta(self, part):
+        try:
+            with open(part + ".json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_part_meta(self, part, meta):
+        save_part_meta(part, meta)
+
+    def _remove_part_meta(self, part):
+        try:
+            os.remove(part + ".json")
+        except OSError:
+            pass
+
+def _content_range_start(value):
+    # "bytes 100-199/200" -> 100
+    match = re.match(r'bytes (\d+)-\d+/', value or '')
+    return int(match.group(1)) if match else None
+
+def _content_range_total(value):
+    # "bytes */200" or "bytes 100-199/200" -> 200
+    match = re.search(r'/(\d+)$', value or '')
+    return int(match.group(1)) if match else None
@@ -1,20 +1,39 @@
 import sys
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Force qtawesome to use PyQt6
 os.environ["QT_API"] = "pyqt6"
 
-import requests
 import qtawesome as qta
-import markdown
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QTreeWidget, QTreeWidgetItem, QListWidget, QListWidgetItem, 
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSlider, 
+                             QTreeView, QListWidget, QListWidgetItem, 
                              QPushButton, QLabel, QProgressBar, QSplitter, QFileDialog, 
                              QFrame, QLineEdit, QDialog, QGraphicsDropShadowEffect, QCheckBox, QTextEdit, QAbstractItemView)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QPoint, QSize, QPropertyAnimation, QEasingCurve, QEvent, QVariantAnimation, QObject
-from PyQt6.QtGui import QIcon, QFont, QColor, QPalette, QBrush
-
-from scraper import HaokeeScraper
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QPoint, QSize, QPropertyAnimation, QEasingCurve, QEvent, QVariantAnimation, QObject, QTimer
+from PyQt6.QtGui import QIcon, QFont, QColor, QPalette, QBrush, QTextCursor, QPixmap
+# Preview playback needs the optional QtMultimedia module
+try:
+    from PyQt6.QtCore import QUrl
+    from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+    from PyQt6.QtMultimediaWidgets import QVideoWidget
+except ImportError:
+    QMediaPlayer = None
+
+from scraper import HaokeeScraper, FetchCancelled
+from downloader import target_path
+from download_queue import DownloadQueue, RUNNING, PAUSED, QUEUED, FAILED, DONE, CANCELLED
+from tree_model import PathIndex, VaultTreeModel, VaultFilterProxyModel, PathRole
+from search_index import SearchIndex, title_of
+from vault_index import heading_key
+from prefetch import Prefetcher
+from render_cache import MarkdownRenderer
+from thumbnails import ThumbnailLoader
+from streaming import StreamServer
+from progress import format_bytes, format_eta
+from throttle import parse_rate
 
 def resource_path(relative_path):
     try:
@@ -63,8 +82,8 @@ QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {{
     background: none;
 }}
 
-/* TreeWidget & ListWidget & TextEdit */
-QTreeWidget, QListWidget, QTextEdit {{
+/* TreeView & ListWidget & TextEdit */
+QTreeView, QListWidget, QTextEdit {{
     background-color: rgba(255, 255, 255, 0.8);
     border: 1px solid #E0E0E0;
     border-radius: 8px;
@@ -77,20 +96,20 @@ QTreeWidget, QListWidget, QTextEdit {{
     border-radius: 6px;
     padding: 5px;
 }}
-QTreeWidget, QListWidget {{
+QTreeView, QListWidget {{
     padding: 5px;
     show-decoration-selected: 0;
 }}
-QTreeWidget::item, QListWidget::item {{
+QTreeView::item, QListWidget::item {{
     padding: 6px;
     border-radius: 4px;
     color: #333333;
     border: 1px solid transparent;
 }}
-QTreeWidget::item:hover, QListWidget::item:hover {{
+QTreeView::item:hover, QListWidget::item:hover {{
     background-color: rgba(0, 0, 0, 0.05);
 }}
-QTreeWidget::item:selected {{
+QTreeView::item:selected {{
     background-color: #F0F0F0;
     color: #0078D4;
     font-weight: bold;
@@ -225,8 +244,23 @@ QCheckBox::indicator:checked {{
 # Threads
 # =============================================================================
 
+FETCH_DEBOUNCE_MS = 150 # Selection must rest this long before a note is fetched
+
+# Basic CSS for rendered notes
+PREVIEW_STYLE = """
+<style>
+body { font-family: 'Segoe UI', sans-serif; color: #333; line-height: 1.6; }
+h1, h2, h3 { color: #0078D4; }
+code { background-color: #f0f0f0; padding: 2px 4px; border-radius: 4px; font-family: Consolas, monospace; }
+pre { background-color: #f6f8fa; padding: 10px; border-radius: 6px; overflow: auto; }
+blockquote { border-left: 4px solid #dfe2e5; color: #6a737d; padding-left: 10px; margin: 0; }
+a { color: #0078D4; text-decoration: none; }
+img { max-width: 100%; }
+</style>
+"""
+
 class InitThread(QThread):
-    finished_signal = pyqtSignal(object) 
+    finished_signal = pyqtSignal(object, bool) # cache, changed since the saved snapshot
     error_signal = pyqtSignal(str)
 
     def __init__(self, scraper):
@@ -237,60 +271,136 @@ class InitThread(QThread):
         try:
             self.scraper.get_site_info()
             cache = self.scraper.get_directory()
-            self.finished_signal.emit(cache)
+            changed = self.scraper.save_snapshot()
+            self.finished_signal.emit(cache, changed)
         except Exception as e:
             self.error_signal.emit(str(e))
 
 class FetchContentThread(QThread):
-    finished_signal = pyqtSignal(str, list)
-    error_signal = pyqtSignal(str)
+    finished_signal = pyqtSignal(int, str, str, list, str, float) # request id, path, content, media, html, render ms
+    error_signal = pyqtSignal(int, str)
 
-    def __init__(self, scraper, path):
+    def __init__(self, scraper, path, request_id, renderer):
         super().__init__()
         self.scraper = scraper
         self.path = path
+        self.request_id = request_id
+        self.renderer = renderer
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
 
     def run(self):
         try:
-            content = self.scraper.get_page_content(self.path)
-            media = self.scraper.extract_media(content)
-            self.finished_signal.emit(content, media)
+            content = self.scraper.get_page_content(self.path, cancel=self.cancel_event)
+            media = self.scraper.extract_media(content, self.path)
+            # Render here rather than on the GUI thread; the GUI only has to setHtml
+            html, render_ms = "", 0.0
+            if content and self.path.lower().endswith('.md') and not self.cancel_event.is_set():
+                html, render_ms, _ = self.renderer.render(content, self.path)
+            self.finished_signal.emit(self.request_id, self.path, content, media, html, render_ms)
+        except FetchCancelled:
+            pass
         except Exception as e:
-            self.error_signal.emit(str(e))
+            self.error_signal.emit(self.request_id, str(e))
 
-class DownloadThread(QThread):
-    progress_signal = pyqtSignal(int, str)
-    finished_signal = pyqtSignal()
-    error_signal = pyqtSignal(str)
+class SearchIndexThread(QThread):
+    progress_signal = pyqtSignal(int, int)
+    finished_signal = pyqtSignal(int) # notes (re)indexed
 
-    def __init__(self, items, dest_folder):
+    def __init__(self, scraper, index, paths, workers=4, pause=0.2):
         super().__init__()
-        self.items = items
-        self.dest_folder = dest_folder
+        self.scraper = scraper
+        self.index = index
+        self.paths = paths
+        self.workers = workers
+        self.pause = pause # Seconds between checks while the user waits on a fetch
+
+    def fetch(self, path):
+        # Never compete with the note the user just opened
+        while self.scraper.transport.has_foreground() and not self.isInterruptionRequested():
+            time.sleep(self.pause)
+        return self.scraper.get_page_content(path, True)
 
     def run(self):
-        total = len(self.items)
-        if total == 0:
-            self.finished_signal.emit()
+        if len(self.index) == 0:
+            self.index.load()
+        self.index.prune(self.paths)
+
+        # Unchanged notes come back from the content cache as a 304, and their
+        # text hashes match, so only edited notes are tokenized again.
+        updated = 0
+        done = 0
+        # A bulk transfer: prefetching waits for it, and it yields to foreground fetches
+        with self.scraper.transport.bulk(), ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.fetch, path): path for path in self.paths}
+            for future in as_completed(futures):
+                if self.isInterruptionRequested():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                try:
+                    content = future.result()
+                except Exception as e:
+                    # One unreachable note shouldn't stop the rest from being indexed
+                    print(f"Skipping {futures[future]} in the search index: {e}")
+                else:
+                    if self.index.update(futures[future], content):
+                        updated += 1
+                done += 1
+                if done % 20 == 0:
+                    self.progress_signal.emit(done, len(self.paths))
+
+        self.index.save()
+        self.finished_signal.emit(updated)
+
+class DownloadThread(QThread):
+    """Works through the persistent download queue, one job at a time, for as long as the app runs."""
+    progress_signal = pyqtSignal(str)
+    bytes_signal = pyqtSignal(object, object) # job, TransferProgress snapshot; at most every 100 ms
+    queue_changed_signal = pyqtSignal()
+    job_finished_signal = pyqtSignal(object, list) # job, results
+
+    def __init__(self, queue, stream_server=None):
+        super().__init__()
+        self.queue = queue
+        self.stream_server = stream_server
+
+    def seed_from_stream(self, job, items):
+        if self.stream_server is None:
             return
-            
-        for i, item in enumerate(self.items):
-            try:
-                self.progress_signal.emit(int((i / total) * 100), f"正在下载 {item['name']}...")
-                
-                resp = requests.get(item['url'], stream=True)
-                resp.raise_for_status()
-                
-                file_path = os.path.join(self.dest_folder, item['name'])
-                with open(file_path, 'wb') as f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        
-            except Exception as e:
-                print(f"Failed to download {item['name']}: {e}")
-                
-        self.progress_signal.emit(100, "下载完成")
-        self.finished_signal.emit()
+        # Bytes already buffered by the preview player become the start of the download
+        for item in items:
+            cache = self.stream_server.cache_for(item['url'])
+            target = target_path(item, job['dest'])
+            if cache is not None and not os.path.exists(target):
+                cache.seed_part(target + ".part")
+
+    def run(self):
+        def on_progress(job, done, total, result):
+            # Called from the engine's workers; Qt queues the signal to the GUI thread
+            if result['cancelled']:
+                return
+            if result['skipped']:
+                state = "已是最新"
+            else:
+                state = "已下载" if result['ok'] else "下载失败"
+            self.progress_signal.emit(f"[{job['name']}] {state} {result['name']} ({done}/{total})")
+            if done == total or done % 10 == 0:
+                self.queue_changed_signal.emit()
+
+        def on_job_finished(job, results):
+            print(f"Transport: {self.queue.transport.stats()}")
+            self.job_finished_signal.emit(job, results)
+
+        self.queue.run(on_change=self.queue_changed_signal.emit, on_progress=on_progress,
+                       on_job_finished=on_job_finished, before_job=self.seed_from_stream,
+                       on_bytes=self.bytes_signal.emit, interval=0.1)
+
+    def stop(self):
+        self.queue.shutdown()
+        self.wait()
 
 # =============================================================================
 # Custom UI Components
@@ -616,6 +726,28 @@ class MainWindow(QMainWindow):
         
         self.scraper = HaokeeScraper()
         self.cache_data = {} # Store directory cache
+        # Snippets are cut from the cached note bodies; the index itself doesn't keep the text
+        self.search_index = SearchIndex(text_source=self.scraper.content_cache.peek)
+        self.renderer = MarkdownRenderer()
+        self.thumbnails = ThumbnailLoader(self.scraper.transport, parent=self)
+        self.thumbnails.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.thumbnail_items = {} # url -> media list items waiting for that thumbnail
+        self.stream_server = StreamServer(self.scraper.transport).start()
+        self.player = None # Created with the player widgets when QtMultimedia is available
+        # Jobs left over from the last session start again on their own
+        self.download_queue = DownloadQueue(self.scraper.transport)
+        self.prefetcher = Prefetcher(self.scraper).start()
+        self.index_thread = None
+        self.pending_heading = None # (path, heading) to scroll to once that note is shown
+        # Selection-driven fetches: debounced, and only the latest request's result is shown
+        self.fetch_request_id = 0
+        self.fetch_path = None
+        self.fetch_thread = None
+        self.fetch_threads = set() # Cancelled threads still winding down
+        self.fetch_timer = QTimer(self)
+        self.fetch_timer.setSingleShot(True)
+        self.fetch_timer.timeout.connect(self.start_fetch)
+        self.preview_is_markdown = False
 
         # Resize Logic
         self._gripSize = 5
@@ -627,6 +759,7 @@ class MainWindow(QMainWindow):
         
         self.setup_ui()
         self.start_initialization()
+        self.start_download_queue()
 
     def setup_ui(self):
         # Main Container
@@ -694,14 +827,35 @@ class MainWindow(QMainWindow):
         
         left_layout.addLayout(header_row)
         
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setHeaderHidden(True)
-        self.tree_widget.itemSelectionChanged.connect(self.on_tree_selection_changed)
-        self.tree_widget.setIconSize(QSize(20, 20))
+        # Full-text Search
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索笔记、标题，或输入 #标签 筛选...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setFixedHeight(32)
+        self.search_input.textChanged.connect(self.on_search_changed)
+        left_layout.addWidget(self.search_input)
+        
+        self.search_results = QListWidget()
+        self.search_results.setVisible(False)
+        self.search_results.setIconSize(QSize(16, 16))
+        self.heading_icon = qta.icon('fa5s.heading', color='#0078D4')
+        self.search_results.setWordWrap(True)
+        self.search_results.itemClicked.connect(self.on_search_result_clicked)
+        self.search_results.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.smooth_scroll_search = SmoothScroll(self.search_results, step_factor=0.5)
+        left_layout.addWidget(self.search_results)
+        
+        self.tree_view = QTreeView()
+        self.tree_view.setHeaderHidden(True)
+        self.tree_view.setIconSize(QSize(20, 20))
+        # All rows share one height, so the view never has to measure them
+        self.tree_view.setUniformRowHeights(True)
         # Smooth Scroll Setup
-        self.tree_widget.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
-        self.smooth_scroll_tree = SmoothScroll(self.tree_widget, step_factor=0.5) # Slower speed
-        left_layout.addWidget(self.tree_widget)
+        self.tree_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.smooth_scroll_tree = SmoothScroll(self.tree_view, step_factor=0.5) # Slower speed
+        left_layout.addWidget(self.tree_view)
+        self.tree_model = None
+        self.tree_proxy = None
         
         # Download This File Button
         self.download_file_btn = QPushButton("下载此文件")
@@ -709,6 +863,18 @@ class MainWindow(QMainWindow):
         self.download_file_btn.clicked.connect(self.on_download_file_clicked)
         left_layout.addWidget(self.download_file_btn)
         
+        # Download Note With Linked Notes Button
+        self.download_linked_btn = QPushButton("下载文章及其链接的文章")
+        self.download_linked_btn.setEnabled(False)
+        self.download_linked_btn.clicked.connect(self.on_download_linked_clicked)
+        left_layout.addWidget(self.download_linked_btn)
+        
+        # Download Folder Media Button
+        self.download_folder_btn = QPushButton("下载文件夹内全部媒体")
+        self.download_folder_btn.setEnabled(False)
+        self.download_folder_btn.clicked.connect(self.on_download_folder_clicked)
+        left_layout.addWidget(self.download_folder_btn)
+        
         splitter.addWidget(left_widget)
         
         # --- Right Panel ---
@@ -735,9 +901,62 @@ class MainWindow(QMainWindow):
         self.smooth_scroll_preview = SmoothScroll(self.preview_text, step_factor=0.5) # Slower speed
         preview_layout.addWidget(self.preview_text)
         
+        # Notes linking here, straight from the link graph
+        self.backlinks_label = QLabel("反向链接")
+        self.backlinks_label.setStyleSheet("color: #666666;")
+        preview_layout.addWidget(self.backlinks_label)
+
+        self.backlinks_list = QListWidget()
+        self.backlinks_list.setMaximumHeight(90)
+        self.backlinks_list.itemClicked.connect(lambda item: self.reveal_in_tree(item.data(Qt.ItemDataRole.UserRole)))
+        preview_layout.addWidget(self.backlinks_list)
+        self.link_icon = qta.icon('fa5s.link', color='#0078D4')
+        
         self.preview_widget.setVisible(False)
         self.right_splitter.addWidget(self.preview_widget)
         
+        # 1b. Audio / Video Preview (streamed through the local range proxy)
+        self.player_widget = QWidget()
+        player_layout = QVBoxLayout(self.player_widget)
+        player_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.player_label = QLabel("媒体预览")
+        self.player_label.setFont(QFont("Segoe UI", 12, QFont.Weight.Bold))
+        player_layout.addWidget(self.player_label)
+
+        if QMediaPlayer is not None:
+            self.video_widget = QVideoWidget()
+            self.video_widget.setMinimumHeight(160)
+            player_layout.addWidget(self.video_widget, 1)
+
+            controls = QHBoxLayout()
+            self.play_btn = QPushButton()
+            self.play_btn.setIcon(qta.icon('fa5s.pause', color='#333333'))
+            self.play_btn.setFixedSize(32, 32)
+            self.play_btn.clicked.connect(self.toggle_playback)
+            controls.addWidget(self.play_btn)
+
+            self.position_slider = QSlider(Qt.Orientation.Horizontal)
+            self.position_slider.sliderMoved.connect(lambda ms: self.player.setPosition(ms))
+            controls.addWidget(self.position_slider, 1)
+
+            self.position_label = QLabel("00:00 / 00:00")
+            controls.addWidget(self.position_label)
+            player_layout.addLayout(controls)
+
+            self.player = QMediaPlayer(self)
+            self.audio_output = QAudioOutput(self)
+            self.player.setAudioOutput(self.audio_output)
+            self.player.setVideoOutput(self.video_widget)
+            self.player.durationChanged.connect(self.on_player_duration_changed)
+            self.player.positionChanged.connect(self.on_player_position_changed)
+            self.player.playbackStateChanged.connect(self.on_playback_state_changed)
+        else:
+            player_layout.addWidget(QLabel("当前环境缺少 QtMultimedia，无法在线预览音视频。"))
+
+        self.player_widget.setVisible(False)
+        self.right_splitter.addWidget(self.player_widget)
+        
         # 2. Media Area
         self.media_widget = QWidget()
         media_layout = QVBoxLayout(self.media_widget)
@@ -749,13 +968,46 @@ class MainWindow(QMainWindow):
         
         self.media_list = QListWidget()
         self.media_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
-        self.media_list.setIconSize(QSize(24, 24))
+        self.media_list.setIconSize(QSize(40, 40))
         # Smooth Scroll Setup
         self.media_list.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
         self.smooth_scroll_media = SmoothScroll(self.media_list, step_factor=0.5) # Slower speed
+        self.media_list.itemDoubleClicked.connect(self.on_media_double_clicked)
         media_layout.addWidget(self.media_list)
         
         self.right_splitter.addWidget(self.media_widget)
+
+        # 3. Download Queue
+        self.queue_widget = QWidget()
+        queue_layout = QVBoxLayout(self.queue_widget)
+        queue_layout.setContentsMargins(0, 0, 0, 0)
+
+        queue_label = QLabel("下载队列")
+        queue_label.setFont(QFont("Segoe UI", 12, QFont.Weight.Bold))
+        queue_layout.addWidget(queue_label)
+
+        self.queue_list = QListWidget()
+        queue_layout.addWidget(self.queue_list)
+
+        queue_buttons = QHBoxLayout()
+        for text, icon, handler in [
+            ("暂停", 'fa5s.pause', self.on_queue_pause_clicked),
+            ("继续", 'fa5s.play', self.on_queue_resume_clicked),
+            ("取消", 'fa5s.times', self.on_queue_cancel_clicked),
+            ("优先", 'fa5s.arrow-up', self.on_queue_priority_clicked),
+            ("清除已完成", 'fa5s.broom', self.on_queue_clear_clicked),
+        ]:
+            btn = QPushButton(text)
+            btn.setIcon(qta.icon(icon, color='#333333'))
+            btn.clicked.connect(handler)
+            queue_buttons.addWidget(btn)
+        self.queue_pause_all_btn = QPushButton("全部暂停")
+        self.queue_pause_all_btn.clicked.connect(self.on_queue_pause_all_clicked)
+        queue_buttons.addWidget(self.queue_pause_all_btn)
+        queue_layout.addLayout(queue_buttons)
+
+        self.queue_widget.setVisible(False)
+        self.right_splitter.addWidget(self.queue_widget)
         right_layout.addWidget(self.right_splitter)
         
         # Download Path
@@ -778,6 +1030,27 @@ class MainWindow(QMainWindow):
         path_layout.addWidget(self.browse_btn)
         
         right_layout.addLayout(path_layout)
+
+        # Bandwidth caps for queued downloads, e.g. 500K or 2M (bytes per second)
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("总限速:"))
+        self.max_rate_input = QLineEdit()
+        self.max_rate_input.setPlaceholderText("不限，如 2M")
+        self.max_rate_input.setFixedHeight(32)
+        rate_layout.addWidget(self.max_rate_input)
+        rate_layout.addWidget(QLabel("每主机:"))
+        self.host_rate_input = QLineEdit()
+        self.host_rate_input.setPlaceholderText("不限，如 500K")
+        self.host_rate_input.setFixedHeight(32)
+        rate_layout.addWidget(self.host_rate_input)
+        # Limits saved with the queue from the last session
+        for field, rate in ((self.max_rate_input, self.download_queue.max_rate),
+                            (self.host_rate_input, self.download_queue.per_host_rate)):
+            if rate:
+                field.setText(f"{rate // 1024}K" if rate % 1024 == 0 else str(rate))
+        self.max_rate_input.editingFinished.connect(self.on_rate_limits_changed)
+        self.host_rate_input.editingFinished.connect(self.on_rate_limits_changed)
+        right_layout.addLayout(rate_layout)
         
         # Download Button
         self.download_media_btn = QPushButton("下载文件中的选定媒体")
@@ -936,6 +1209,24 @@ class MainWindow(QMainWindow):
                 """)
         super().changeEvent(event)
 
+    def closeEvent(self, event):
+        # Persist LRU access times so eviction order survives restarts
+        self.scraper.content_cache.flush()
+        self.prefetcher.stop()
+        self.cancel_fetch()
+        self.thumbnails.shutdown()
+        self.stop_playback()
+        self.stream_server.stop()
+        # Whatever is unfinished is saved and picked up on the next launch
+        self.download_thread.stop()
+        if self.index_thread is not None:
+            self.index_thread.requestInterruption()
+            self.index_thread.wait()
+        # Writing the index can take seconds on a large vault; the window closes meanwhile,
+        # and the (non-daemon) thread keeps the process alive until the file is written
+        threading.Thread(target=self.search_index.save, name="search-index-save").start()
+        super().closeEvent(event)
+
     def show_help(self):
         dlg = HelpDialog(self)
         dlg.exec()
@@ -952,114 +1243,198 @@ class MainWindow(QMainWindow):
             self.path_input.setText(folder)
 
     def start_initialization(self):
-        self.status_label.setText("正在连接 Haokee Note...")
+        # Show the last known directory immediately, then refresh it in the background
+        self.has_snapshot = self.scraper.load_snapshot()
+        if self.has_snapshot:
+            self.cache_data = self.scraper.cache_data
+            self.populate_tree(self.cache_data)
+            self.status_label.setText("已加载本地目录，正在后台检查更新...")
+        else:
+            self.status_label.setText("正在连接 Haokee Note...")
+            self.tree_view.setEnabled(False)
         self.status_icon.clear()
-        self.tree_widget.setEnabled(False)
         
         self.init_thread = InitThread(self.scraper)
         self.init_thread.finished_signal.connect(self.on_init_finished)
         self.init_thread.error_signal.connect(self.on_init_error)
         self.init_thread.start()
 
-    def on_init_finished(self, cache_data):
-        self.status_label.setText("目录加载完成。")
-        self.tree_widget.setEnabled(True)
+    def on_init_finished(self, cache_data, changed):
+        self.tree_view.setEnabled(True)
+        if self.has_snapshot and not changed:
+            self.status_label.setText("目录已是最新。")
+            return
+        self.status_label.setText("目录已更新。" if self.has_snapshot else "目录加载完成。")
         self.cache_data = cache_data
         self.populate_tree(cache_data)
 
     def on_init_error(self, error_msg):
+        if self.has_snapshot:
+            # Still usable offline with the snapshot, no need for a modal error
+            self.status_label.setText("无法连接服务器，正在使用本地目录。")
+            self.status_icon.setPixmap(qta.icon('fa5s.exclamation-circle', color='#FBC02D').pixmap(16, 16))
+            return
         self.status_label.setText("连接失败。")
         self.status_icon.setPixmap(qta.icon('fa5s.exclamation-circle', color='#E81123').pixmap(16, 16))
         self.show_message("连接错误", f"无法连接到服务器: {error_msg}", is_error=True)
 
     def refresh_tree(self):
-        self.populate_tree(self.cache_data)
+        # Only the filter changes; the tree itself, expansion and selection stay as they are
+        if self.tree_proxy is not None:
+            self.tree_proxy.set_filter(show_media=self.show_media_chk.isChecked())
 
     def populate_tree(self, cache_data):
-        self.tree_widget.clear()
-        
-        # Build hierarchical structure first
-        tree_structure = {}
-        
-        show_media = self.show_media_chk.isChecked()
-        
-        for path in cache_data.keys():
-            # Filter Logic
-            is_md = path.endswith('.md')
-            if not show_media and not is_md:
-                continue
-
-            parts = path.split('/')
-            current_level = tree_structure
-            for i, part in enumerate(parts):
-                if part not in current_level:
-                    current_level[part] = {}
-                current_level = current_level[part]
-        
-        # Recursive function to add items with sorting
-        def add_items_recursive(parent_item, structure, current_path_prefix=""):
-            # Sort keys: Folder > MD > Other, then Alphabetical
-            def sort_key(name):
-                is_folder = bool(structure[name])
-                is_md = name.endswith('.md')
-                
-                # Priority: 
-                # 0: Folder
-                # 1: MD File
-                # 2: Other File
-                type_priority = 2
-                if is_folder:
-                    type_priority = 0
-                elif is_md:
-                    type_priority = 1
-                    
-                return (type_priority, name.lower())
-
-            sorted_keys = sorted(structure.keys(), key=sort_key)
-            
-            folder_icon = qta.icon('fa5s.folder', color='#FBC02D')
-            file_icon = qta.icon('fa5s.file-alt', color='#42A5F5')
-            media_icon = qta.icon('fa5s.image', color='#AB47BC')
-
-            for key in sorted_keys:
-                full_path = f"{current_path_prefix}/{key}" if current_path_prefix else key
-                item = QTreeWidgetItem([key])
-                item.setData(0, Qt.ItemDataRole.UserRole, full_path)
-                
-                is_folder = bool(structure[key])
-                if is_folder:
-                    item.setIcon(0, folder_icon)
-                    add_items_recursive(item, structure[key], full_path)
-                else:
-                    if key.endswith('.md'):
-                        item.setIcon(0, file_icon)
-                    else:
-                        item.setIcon(0, media_icon)
-                
-                if parent_item:
-                    parent_item.addChild(item)
-                else:
-                    self.tree_widget.addTopLevelItem(item)
+        # Rows are created lazily by the model as folders get expanded
+        self.tree_model = VaultTreeModel(PathIndex(cache_data.keys()), self)
+        self.tree_proxy = VaultFilterProxyModel(self)
+        self.tree_proxy.set_filter(show_media=self.show_media_chk.isChecked())
+        self.tree_proxy.setSourceModel(self.tree_model)
+        self.tree_view.setModel(self.tree_proxy)
+        self.tree_view.selectionModel().selectionChanged.connect(self.on_tree_selection_changed)
+        self.start_search_indexing()
+
+    def start_search_indexing(self):
+        if self.index_thread is not None and self.index_thread.isRunning():
+            # Picks up the new directory on its next run
+            self.index_thread.finished.connect(self.start_search_indexing, Qt.ConnectionType.SingleShotConnection)
+            return
+        notes = [path for path in self.cache_data if path.endswith('.md')]
+        self.index_thread = SearchIndexThread(self.scraper, self.search_index, notes)
+        self.index_thread.finished_signal.connect(self.on_search_index_finished)
+        self.index_thread.start()
+
+    def on_search_index_finished(self, updated):
+        print(f"Search index: {len(self.search_index)} notes, {updated} updated.")
+        # Results shown while the index was still filling may be incomplete
+        if self.search_input.text().strip():
+            self.on_search_changed(self.search_input.text())
+
+    def on_search_changed(self, text):
+        query = text.strip()
+        self.search_results.setVisible(bool(query))
+        self.tree_view.setVisible(not query)
+        if not query:
+            return
+
+        start = time.perf_counter()
+        self.search_results.clear()
+        metadata = self.scraper.metadata_index
+        if query.startswith('#'):
+            # Tag filter straight from the directory metadata
+            notes = metadata.notes_with_tag(query)
+            for path in sorted(notes):
+                self.add_search_result(path, " ".join(notes[path]))
+            count = len(notes)
+        else:
+            headings = metadata.find_headings(query, limit=10)
+            for path, heading, level, line, occurrence in headings:
+                item = self.add_search_result(path, f"{'#' * level} {heading}", icon=self.heading_icon)
+                item.setData(Qt.ItemDataRole.UserRole + 1, (heading, line, occurrence))
+            results = self.search_index.search(query)
+            for path, score, snippet in results:
+                self.add_search_result(path, snippet)
+            count = len(headings) + len(results)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        building = self.index_thread is not None and self.index_thread.isRunning()
+        suffix = "（索引仍在建立中）" if building else ""
+        self.status_label.setText(f"找到 {count} 条结果，用时 {elapsed:.1f} ms{suffix}")
+        self.status_icon.clear()
 
-        add_items_recursive(None, tree_structure)
+    def add_search_result(self, path, detail, icon=None):
+        item = QListWidgetItem(f"{title_of(path)}\n{detail}")
+        item.setData(Qt.ItemDataRole.UserRole, path)
+        item.setToolTip(path)
+        if icon is not None:
+            item.setIcon(icon)
+        self.search_results.addItem(item)
+        return item
+
+    def on_search_result_clicked(self, item):
+        path = item.data(Qt.ItemDataRole.UserRole)
+        heading = item.data(Qt.ItemDataRole.UserRole + 1)
+        if heading is None:
+            self.reveal_in_tree(path)
+            return
+        if self.selected_tree_path() == path and self.preview_widget.isVisible():
+            # Already showing this note, just scroll
+            self.jump_to_heading(*heading)
+            return
+        # Scroll once the note has been fetched and rendered
+        self.pending_heading = (path, heading)
+        self.reveal_in_tree(path)
+
+    def jump_to_heading(self, heading, line, occurrence):
+        doc = self.preview_text.document()
+        if self.preview_is_markdown:
+            # Rendered HTML has no source lines: take the nth heading block with this text,
+            # so the same words in body text (or inline markdown in the heading) don't throw it off
+            cursor = QTextCursor(doc)
+            key = heading_key(heading)
+            seen = 0
+            block = doc.begin()
+            while block.isValid():
+                if block.blockFormat().headingLevel() > 0 and heading_key(block.text()) == key:
+                    cursor = QTextCursor(block)
+                    if seen == occurrence:
+                        break
+                    seen += 1
+                block = block.next()
+        else:
+            cursor = QTextCursor(doc.findBlockByLineNumber(line))
+        self.preview_text.setTextCursor(cursor)
+        scroll_bar = self.preview_text.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.value() + self.preview_text.cursorRect(cursor).top())
+
+    def reveal_in_tree(self, path):
+        """Selects path in the tree (expanding its folders), which also loads its preview."""
+        if self.tree_proxy is None:
+            return
+        index = self.tree_proxy.index_for_path(path)
+        if not index.isValid():
+            return
+        self.tree_view.scrollTo(index)
+        self.tree_view.setCurrentIndex(index)
+
+    def selected_tree_path(self):
+        if self.tree_model is None:
+            return None
+        indexes = self.tree_view.selectionModel().selectedIndexes()
+        if not indexes:
+            return None
+        return indexes[0].data(PathRole)
 
     def on_tree_selection_changed(self):
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
+        self.cancel_fetch()
+        self.stop_playback()
+        path = self.selected_tree_path()
+        if not path:
             self.download_file_btn.setEnabled(False)
+            self.download_linked_btn.setEnabled(False)
+            self.download_folder_btn.setEnabled(False)
             return
-            
-        item = selected_items[0]
-        path = item.data(0, Qt.ItemDataRole.UserRole)
         
         # Check if it's a file (leaf node logic simplified)
         # Actually checking if it's in cache keys is better
         is_file = path in self.cache_data
         self.download_file_btn.setEnabled(is_file)
+        self.download_linked_btn.setEnabled(path.endswith('.md'))
+        self.download_folder_btn.setEnabled(not is_file)
         
         ext = path.split('.')[-1].lower() if '.' in path else ''
-        if ext in ['md', 'js', 'css', 'html', 'json', 'txt', 'py', 'xml']:
+        if not is_file:
+            # Folder: list everything its notes embed, no note needs to be fetched
+            media_files = self.scraper.get_folder_media(path)
+            self.populate_media_list(media_files)
+            self.preview_widget.setVisible(False)
+            self.status_label.setText(f"文件夹 {path} 中的文章共引用 {len(media_files)} 个媒体文件。")
+            self.status_icon.clear()
+        elif ext in ['md', 'js', 'css', 'html', 'json', 'txt', 'py', 'xml']:
             self.fetch_content(path)
+        elif self.scraper.get_file_type(path) in ('audio', 'video'):
+            self.media_list.clear()
+            self.preview_widget.setVisible(False)
+            self.play_media(self.scraper.media_entry(path))
         else:
             self.media_list.clear()
             self.preview_widget.setVisible(False)
@@ -1069,39 +1444,81 @@ class MainWindow(QMainWindow):
     def fetch_content(self, path):
         self.status_label.setText(f"正在获取: {path}...")
         self.status_icon.setPixmap(qta.icon('fa5s.spinner', color='#0078D4', animation=qta.Spin(self.status_icon)).pixmap(16, 16))
-        self.media_list.clear()
-        
-        self.fetch_thread = FetchContentThread(self.scraper, path)
-        self.fetch_thread.finished_signal.connect(lambda content, media: self.on_content_fetched(content, media, path))
-        self.fetch_thread.error_signal.connect(self.on_content_error)
-        self.fetch_thread.start()
-
-    def on_content_fetched(self, content, media_files, path=""):
-        self.status_label.setText(f"发现 {len(media_files)} 个媒体文件。")
+        # The directory metadata already knows what the note embeds, show that right away
+        self.populate_media_list(self.scraper.get_note_media(path))
+        self.populate_backlinks(path)
+
+        self.cancel_fetch()
+        self.fetch_path = path
+        # Arrow-keying through the tree restarts the timer, so only the note the user stops on is
+        # fetched; notes already in memory (prefetched or just read) are shown without waiting
+        self.fetch_timer.start(0 if path in self.scraper.memory_cache else FETCH_DEBOUNCE_MS)
+
+    def cancel_fetch(self):
+        """Drops the pending or in-flight fetch; its result, if any, will be ignored."""
+        self.fetch_timer.stop()
+        self.fetch_request_id += 1
+        if self.fetch_thread is not None:
+            self.fetch_thread.cancel()
+            self.fetch_thread = None
+
+    def start_fetch(self):
+        thread = FetchContentThread(self.scraper, self.fetch_path, self.fetch_request_id, self.renderer)
+        thread.finished_signal.connect(self.on_fetch_finished)
+        thread.error_signal.connect(self.on_fetch_error)
+        # Keep a reference until the thread has really stopped, even after it's superseded
+        self.fetch_threads.add(thread)
+        thread.finished.connect(lambda: self.fetch_threads.discard(thread))
+        self.fetch_thread = thread
+        thread.start()
+
+    def on_fetch_finished(self, request_id, path, content, media_files, html, render_ms):
+        if request_id != self.fetch_request_id:
+            return # Stale: the selection changed while this was loading
+        self.fetch_thread = None
+        self.on_content_fetched(content, media_files, path, html, render_ms)
+
+    def on_fetch_error(self, request_id, error_msg):
+        if request_id != self.fetch_request_id:
+            return
+        self.fetch_thread = None
+        self.on_content_error(error_msg)
+
+    def on_content_fetched(self, content, media_files, path="", html="", render_ms=0.0):
+        if path.endswith('.md') and content:
+            # Keep search results in step with what the user just read
+            self.search_index.update(path, content)
+            # Fetch the notes they'll probably open next while they read this one
+            self.prefetcher.schedule(path)
+        
+        # Metadata first, then anything the body references that the metadata missed
+        indexed = self.scraper.get_note_media(path)
+        known = set(m['path'] for m in indexed)
+        media_files = indexed + [m for m in media_files if m['path'] not in known]
+        
+        status = f"发现 {len(media_files)} 个媒体文件。"
+        if render_ms >= 1:
+            status += f"（渲染耗时 {render_ms:.0f} ms）"
+        self.status_label.setText(status)
         self.status_icon.setPixmap(qta.icon('fa5s.check-circle', color='#107C10').pixmap(16, 16))
-        self.media_list.clear()
         
         # Show Preview
         self.preview_widget.setVisible(True)
         
-        if path.lower().endswith('.md'):
-            html = markdown.markdown(content, extensions=['extra', 'nl2br', 'codehilite'])
-            # Add some basic CSS for better look
-            style = """
-            <style>
-            body { font-family: 'Segoe UI', sans-serif; color: #333; line-height: 1.6; }
-            h1, h2, h3 { color: #0078D4; }
-            code { background-color: #f0f0f0; padding: 2px 4px; border-radius: 4px; font-family: Consolas, monospace; }
-            pre { background-color: #f6f8fa; padding: 10px; border-radius: 6px; overflow: auto; }
-            blockquote { border-left: 4px solid #dfe2e5; color: #6a737d; padding-left: 10px; margin: 0; }
-            a { color: #0078D4; text-decoration: none; }
-            img { max-width: 100%; }
-            </style>
-            """
-            self.preview_text.setHtml(style + html)
+        self.preview_is_markdown = path.lower().endswith('.md')
+        if self.preview_is_markdown:
+            if not html:
+                html, render_ms, _ = self.renderer.render(content, path)
+            self.preview_text.setHtml(PREVIEW_STYLE + html)
         else:
             self.preview_text.setText(content)
         
+        if self.pending_heading is not None:
+            pending_path, heading = self.pending_heading
+            self.pending_heading = None
+            if pending_path == path:
+                self.jump_to_heading(*heading)
+        
         # Adjust splitter if needed, but let user decide or default 50/50
         # If media files are empty, maybe give more space to preview?
         if not media_files:
@@ -1109,6 +1526,14 @@ class MainWindow(QMainWindow):
         else:
              self.right_splitter.setSizes([300, 300])
 
+        self.populate_media_list(media_files)
+
+    def populate_media_list(self, media_files):
+        self.media_list.clear()
+        # Thumbnails still queued for the previous list aren't needed any more
+        self.thumbnails.cancel_pending()
+        self.thumbnail_items = {}
+
         img_icon = qta.icon('fa5s.image', color='#AB47BC')
         audio_icon = qta.icon('fa5s.music', color='#66BB6A')
         video_icon = qta.icon('fa5s.video', color='#EF5350')
@@ -1119,7 +1544,13 @@ class MainWindow(QMainWindow):
             item.setData(Qt.ItemDataRole.UserRole, media)
             
             if media['type'] == 'image':
-                item.setIcon(img_icon)
+                thumbnail = self.thumbnails.request(media['url'])
+                if thumbnail is not None:
+                    item.setIcon(QIcon(QPixmap.fromImage(thumbnail)))
+                else:
+                    # Placeholder until the thumbnail arrives
+                    item.setIcon(img_icon)
+                    self.thumbnail_items.setdefault(media['url'], []).append(item)
             elif media['type'] == 'audio':
                 item.setIcon(audio_icon)
             elif media['type'] == 'video':
@@ -1129,17 +1560,82 @@ class MainWindow(QMainWindow):
                 
             self.media_list.addItem(item)
 
+    def on_thumbnail_ready(self, url, image):
+        items = self.thumbnail_items.pop(url, None)
+        if not items:
+            return
+        icon = QIcon(QPixmap.fromImage(image))
+        for item in items:
+            item.setIcon(icon)
+
+    def populate_backlinks(self, path):
+        self.backlinks_list.clear()
+        sources = self.scraper.link_graph.backlinks_to(path)
+        self.backlinks_label.setText(f"反向链接 ({len(sources)})")
+        for source in sources:
+            item = QListWidgetItem(self.link_icon, title_of(source))
+            item.setData(Qt.ItemDataRole.UserRole, source)
+            item.setToolTip(source)
+            self.backlinks_list.addItem(item)
+        self.backlinks_list.setVisible(bool(sources))
+
+    def on_media_double_clicked(self, item):
+        media = item.data(Qt.ItemDataRole.UserRole)
+        if media['type'] in ('audio', 'video'):
+            self.play_media(media)
+
+    def play_media(self, media):
+        """Streams an audio / video file: playback starts after the first blocks arrive."""
+        self.player_widget.setVisible(True)
+        self.player_label.setText(f"媒体预览: {media['name']}")
+        self.status_label.setText(f"预览: {media['path']}")
+        self.status_icon.clear()
+        if self.player is None:
+            return
+        self.video_widget.setVisible(media['type'] == 'video')
+        local_url = self.stream_server.open(media['url'], media['name'])
+        self.player.setSource(QUrl(local_url))
+        self.player.play()
+
+    def stop_playback(self):
+        if self.player is not None:
+            self.player.stop()
+            self.player.setSource(QUrl())
+        self.player_widget.setVisible(False)
+
+    def toggle_playback(self):
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+        else:
+            self.player.play()
+
+    def on_playback_state_changed(self, state):
+        playing = state == QMediaPlayer.PlaybackState.PlayingState
+        self.play_btn.setIcon(qta.icon('fa5s.pause' if playing else 'fa5s.play', color='#333333'))
+
+    def on_player_duration_changed(self, duration):
+        self.position_slider.setRange(0, duration)
+
+    def on_player_position_changed(self, position):
+        if not self.position_slider.isSliderDown():
+            self.position_slider.setValue(position)
+
+        def fmt(ms):
+            seconds = ms // 1000
+            return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+        self.position_label.setText(f"{fmt(position)} / {fmt(self.player.duration())}")
+
     def on_content_error(self, error_msg):
         self.status_label.setText("获取内容失败。")
         self.status_icon.setPixmap(qta.icon('fa5s.times-circle', color='#E81123').pixmap(16, 16))
         self.show_message("获取错误", f"无法获取文章内容: {error_msg}", is_error=True)
 
     def on_download_file_clicked(self):
-        selected_items = self.tree_widget.selectedItems()
-        if not selected_items:
+        path = self.selected_tree_path()
+        if not path:
             return
             
-        path = selected_items[0].data(0, Qt.ItemDataRole.UserRole)
         # Construct item dict for DownloadThread
         # We need URL. 
         # For .md files, URL is access URL. For others, it's file URL.
@@ -1152,7 +1648,28 @@ class MainWindow(QMainWindow):
             'url': url
         }
         
-        self.start_download([item])
+        self.start_download([item], name)
+
+    def on_download_linked_clicked(self):
+        path = self.selected_tree_path()
+        if not path:
+            return
+
+        # Keeps the vault layout so the downloaded notes' relative links still work
+        items = self.scraper.get_linked_items(path)
+        self.start_download(items, f"{title_of(path)} 及其链接")
+
+    def on_download_folder_clicked(self):
+        path = self.selected_tree_path()
+        if not path:
+            return
+            
+        media_files = self.scraper.get_folder_media(path)
+        if not media_files:
+            self.show_message("提示", "该文件夹中的文章没有引用任何媒体文件。")
+            return
+            
+        self.start_download(media_files, f"{path} 的媒体")
 
     def on_download_media_clicked(self):
         selected_items = self.media_list.selectedItems()
@@ -1163,7 +1680,7 @@ class MainWindow(QMainWindow):
         items_to_download = [item.data(Qt.ItemDataRole.UserRole) for item in selected_items]
         self.start_download(items_to_download)
 
-    def start_download(self, items):
+    def start_download(self, items, name=None):
         dest_folder = self.path_input.text()
         if not os.path.exists(dest_folder):
             try:
@@ -1171,34 +1688,150 @@ class MainWindow(QMainWindow):
             except OSError:
                 self.show_message("路径错误", "目标文件夹不存在且无法创建。", is_error=True)
                 return
-        
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setValue(0)
-        self.download_media_btn.setEnabled(False)
-        self.download_file_btn.setEnabled(False)
+
+        name = name or (items[0]['name'] if len(items) == 1 else f"{len(items)} 个文件")
+        job = self.download_queue.add(items, dest_folder, name)
+        if job is None:
+            self.status_label.setText("这些文件已在下载队列中。")
+            return
+        self.status_label.setText(f"已加入下载队列: {name}")
         self.status_icon.setPixmap(qta.icon('fa5s.spinner', color='#0078D4', animation=qta.Spin(self.status_icon)).pixmap(16, 16))
-        
-        self.download_thread = DownloadThread(items, dest_folder)
+        self.refresh_queue()
+
+    def start_download_queue(self):
+        self.download_thread = DownloadThread(self.download_queue, stream_server=self.stream_server)
         self.download_thread.progress_signal.connect(self.on_download_progress)
-        self.download_thread.finished_signal.connect(self.on_download_finished)
+        self.download_thread.bytes_signal.connect(self.on_download_bytes)
+        self.download_thread.queue_changed_signal.connect(self.refresh_queue)
+        self.download_thread.job_finished_signal.connect(self.on_download_finished)
         self.download_thread.start()
+        self.refresh_queue()
 
-    def on_download_progress(self, percent, message):
-        self.progress_bar.setValue(percent)
-        self.status_label.setText(message)
+    def refresh_queue(self):
+        states = {
+            QUEUED: "等待中", RUNNING: "下载中", PAUSED: "已暂停",
+            DONE: "已完成", FAILED: "有失败", CANCELLED: "已取消",
+        }
+        jobs = self.download_queue.jobs()
+        selected = self.selected_job_id()
+        self.queue_list.clear()
+        for job in jobs:
+            text = f"{job['name']}  —  {states[job['state']]}  {job['done']}/{job['total']}"
+            if job['failed']:
+                text += f"（失败 {job['failed']}）"
+            if job['priority']:
+                text += f"  优先级 {job['priority']}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, job['id'])
+            item.setToolTip(job['dest'])
+            self.queue_list.addItem(item)
+            if job['id'] == selected:
+                item.setSelected(True)
+        self.queue_widget.setVisible(bool(jobs))
+        running = any(job['state'] == RUNNING for job in jobs)
+        self.progress_bar.setVisible(running)
+        self.queue_pause_all_btn.setText("全部继续" if self.download_queue.paused else "全部暂停")
+
+    def selected_job_id(self):
+        items = self.queue_list.selectedItems()
+        return items[0].data(Qt.ItemDataRole.UserRole) if items else None
+
+    def on_queue_pause_clicked(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_queue.pause(job_id)
+            self.refresh_queue()
+
+    def on_queue_resume_clicked(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_queue.resume(job_id)
+            self.refresh_queue()
+
+    def on_queue_cancel_clicked(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_queue.cancel(job_id)
+            self.refresh_queue()
+
+    def on_queue_priority_clicked(self):
+        job_id = self.selected_job_id()
+        if job_id is None:
+            return
+        top = max(job['priority'] for job in self.download_queue.jobs())
+        self.download_queue.set_priority(job_id, top + 1)
+        self.refresh_queue()
 
-    def on_download_finished(self):
-        self.download_media_btn.setEnabled(True)
-        # Re-enable file btn if selection is valid
-        if self.tree_widget.selectedItems():
-            self.download_file_btn.setEnabled(True)
-            
-        self.progress_bar.setVisible(False)
-        self.status_label.setText("下载任务已完成！")
+    def on_queue_clear_clicked(self):
+        self.download_queue.clear_finished()
+        self.refresh_queue()
+
+    def on_queue_pause_all_clicked(self):
+        if self.download_queue.paused:
+            self.download_queue.resume_all()
+        else:
+            self.download_queue.pause_all()
+        self.refresh_queue()
+
+    def on_rate_limits_changed(self):
+        try:
+            max_rate = parse_rate(self.max_rate_input.text())
+            per_host_rate = parse_rate(self.host_rate_input.text())
+        except ValueError:
+            self.status_label.setText("限速格式无效，应为如 500K、2M 的数值。")
+            self.status_label.setStyleSheet("color: #E81123; font-weight: bold;")
+            return
+        self.download_queue.set_rate_limits(max_rate, per_host_rate)
+        self.status_label.setStyleSheet("")
+        self.status_label.setText(f"下载限速: 总计 {self.format_rate(max_rate)}，每主机 {self.format_rate(per_host_rate)}")
+
+    @staticmethod
+    def format_rate(rate):
+        return f"{format_bytes(rate)}/s" if rate else "不限"
+
+    def on_download_progress(self, message):
+        # The status line shows byte progress; the last finished file goes in its tooltip
+        self.status_label.setToolTip(message)
+
+    def on_download_bytes(self, job, snapshot):
+        self.progress_bar.setValue(int(snapshot['fraction'] * 100))
+        total = format_bytes(snapshot['total_bytes'])
+        if not snapshot['exact']:
+            total = "约 " + total # Some sizes are still estimates
+        text = f"[{job['name']}] 已下载 {format_bytes(snapshot['done_bytes'])} / {total}"
+        text += f" · {format_bytes(snapshot['rate'])}/s · 剩余 {format_eta(snapshot['eta'])}"
+        text += f" ({snapshot['files_done']}/{snapshot['file_count']})"
+        self.status_label.setText(text)
+
+        lines = []
+        for entry in snapshot['active']:
+            if entry['expected']:
+                lines.append(f"{entry['name']}  {entry['received'] * 100 // entry['expected']}%")
+            else:
+                lines.append(f"{entry['name']}  {format_bytes(entry['received'])}")
+        self.progress_bar.setToolTip("\n".join(lines))
+
+    def on_download_finished(self, job, results):
+        self.refresh_queue()
+
+        failed = [r for r in results if not r['ok'] and not r['cancelled']]
+        if failed:
+            self.status_label.setText(f"{job['name']} 下载完成: 成功 {len(results) - len(failed)} 个，失败 {len(failed)} 个。")
+            self.status_label.setStyleSheet("color: #E81123; font-weight: bold;")
+            self.status_icon.setPixmap(qta.icon('fa5s.exclamation-circle', color='#E81123').pixmap(16, 16))
+            details = "<br>".join(f"{r['name']}: {r['error']}" for r in failed[:10])
+            if len(failed) > 10:
+                details += f"<br>... 以及其他 {len(failed) - 10} 个文件"
+            self.show_message("部分下载失败", details, is_error=True)
+            return
+
+        skipped = sum(1 for r in results if r['skipped'])
+        if skipped:
+            self.status_label.setText(f"{job['name']} 下载完成！跳过 {skipped} 个未变化的文件。")
+        else:
+            self.status_label.setText(f"{job['name']} 下载完成！")
         self.status_label.setStyleSheet("color: #107C10; font-weight: bold;")
         self.status_icon.setPixmap(qta.icon('fa5s.check-circle', color='#107C10').pixmap(16, 16))
-        
-        QThread.msleep(100)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
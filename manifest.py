@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_NAME = ".haokee-manifest.json"
+
+class DownloadManifest:
+    """
+    Per-destination record of downloaded files (source URL, size, ETag, content hash),
+    used to skip files that are already up to date on re-runs.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _key(self, target):
+        # Relative, forward-slash keys keep the manifest valid if the folder is moved
+        return os.path.relpath(target, self.folder).replace(os.sep, '/')
+
+    def get(self, target):
+        with self._lock:
+            return self.entries.get(self._key(target))
+
+    def is_current(self, target, url, verify_hash=False):
+        """True if target was downloaded from url and hasn't been touched locally since."""
+        entry = self.get(target)
+        if not entry or entry.get('url') != url:
+            return False
+        try:
+            stat = os.stat(target)
+        except OSError:
+            return False
+        if stat.st_size != entry.get('size'):
+            return False
+        if verify_hash:
+            return file_sha256(target) == entry.get('sha256')
+        return stat.st_mtime == entry.get('mtime')
+
+    def matches_remote(self, target, headers):
+        """Compares a HEAD response's headers with what we recorded for target."""
+        entry = self.get(target) or {}
+        etag = headers.get('ETag')
+        if etag and entry.get('etag'):
+            return etag == entry['etag']
+        length = headers.get('Content-Length')
+        if length and length.isdigit() and int(length) != entry.get('size'):
+            return False
+        modified = headers.get('Last-Modified')
+        if modified and entry.get('last_modified'):
+            return modified == entry['last_modified']
+        # Nothing to compare against; trust the local record
+        return True
+
+    def record(self, target, url, size, sha256, etag=None, last_modified=None):
+        entry = {
+            'url': url,
+            'size': size,
+            'sha256': sha256,
+            'etag': etag,
+            'last_modified': last_modified,
+            'mtime': os.stat(target).st_mtime,
+        }
+        with self._lock:
+            self.entries[self._key(target)] = entry
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Returns a sha256 object fed with the file's bytes, so callers can keep appending."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+def file_sha256(path):
+    return file_digest(path).hexdigest()
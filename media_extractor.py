@@ -0,0 +1,42 @@
+import re
+from urllib.parse import unquote
+
+# One alternation, compiled once, so a note is scanned in a single pass:
+#   ![[pic.png|300]]  ![[pic.png#anchor]]
+#   ![alt](pic.png)   ![alt](<my pic.png> "title")
+#   <img src="pic.png">  <audio src='a.mp3'>  <video src=v.mp4>  <source src="v.webm">
+_MEDIA_LINK = re.compile(r'''
+      !\[\[ (?P<wiki>[^\]\n]+) \]\]
+    | !\[ [^\]\n]* \]\( \s* (?: <(?P<angle>[^>\n]+)> | (?P<md>[^)\s]+) ) (?:\s+["'][^"'\n]*["'])? \s* \)
+    | <(?:img|audio|video|source)\b [^>]*? \bsrc \s*=\s* (?: "(?P<dq>[^"]*)" | '(?P<sq>[^']*)' | (?P<bare>[^\s>]+) )
+''', re.IGNORECASE | re.VERBOSE)
+
+_EXTERNAL = re.compile(r'^[a-z][a-z0-9+.-]*:', re.IGNORECASE) # http:, https:, data:, ...
+
+def extract_links(content):
+    """
+    Returns the vault-relative targets of every media embed in content, in order of
+    first appearance and without duplicates. Size / alias (|300) and anchor (#x)
+    suffixes are dropped; external URLs are skipped.
+    """
+    if not content:
+        return []
+
+    seen = set()
+    links = []
+    for match in _MEDIA_LINK.finditer(content):
+        wiki = match.group('wiki')
+        if wiki is not None:
+            target = wiki.split('|', 1)[0]
+        else:
+            target = match.group('angle') or match.group('md') or match.group('dq') or match.group('sq') or match.group('bare') or ''
+            if _EXTERNAL.match(target):
+                continue
+            # Standard links and HTML are URL-encoded ("my%20pic.png") and may carry ?query
+            target = unquote(target.split('?', 1)[0])
+
+        target = target.split('#', 1)[0].strip()
+        if target and target not in seen:
+            seen.add(target)
+            links.append(target)
+    return links
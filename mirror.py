@@ -0,0 +1,151 @@
+"""
+Headless mirror of the vault (or a sub-folder of it) into a local directory.
+
+    python mirror.py -o D:/backup/haokee-note
+    python mirror.py -o ./songs --prefix 歌曲 --exclude "*.mp4" -j 16
+
+Keeps the vault's folder layout, downloads notes and every media file they
+reference in parallel, and skips files that are unchanged since the last run.
+Does not import PyQt6, so it can run on a server under cron.
+"""
+import argparse
+import fnmatch
+import os
+import sys
+import time
+
+from scraper import HaokeeScraper
+from downloader import DownloadEngine
+from throttle import parse_rate
+from progress import format_bytes
+
+def in_prefix(path, prefix):
+    prefix = prefix.strip('/')
+    return not prefix or path == prefix or path.startswith(prefix + '/')
+
+def matches(path, include, exclude):
+    if include and not any(fnmatch.fnmatch(path, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatch(path, pattern) for pattern in exclude)
+
+def select_paths(cache_data, prefix="", include=(), exclude=()):
+    """Splits the vault entries under prefix into (notes, other files)."""
+    notes, files = [], []
+    for path in cache_data:
+        if not in_prefix(path, prefix) or not matches(path, include, exclude):
+            continue
+        (notes if path.endswith('.md') else files).append(path)
+    return sorted(notes), sorted(files)
+
+def read_local_note(output, path):
+    try:
+        with open(os.path.join(output, *path.split('/')), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+class Mirror:
+    def __init__(self, scraper, output, concurrency=8, check_remote=False, verbose=True,
+                 max_rate=None, per_host_rate=None):
+        self.scraper = scraper
+        self.output = output
+        self.verbose = verbose
+        self.transferred = 0 # Bytes received over the network, across both passes
+        # Each host starts below the cap, leaving the limiter room to grow where it helps
+        self.engine = DownloadEngine(scraper.transport, concurrency=concurrency, per_host=max(1, concurrency // 2),
+                                     check_remote=check_remote, max_rate=max_rate, per_host_rate=per_host_rate)
+
+    def _items(self, paths):
+        return [{'name': path.split('/')[-1], 'target': path, 'url': self.scraper.construct_url(path)}
+                for path in paths]
+
+    def _report(self, done, total, result):
+        if not self.verbose:
+            return
+        if result['skipped']:
+            state = "skip"
+        else:
+            state = "ok  " if result['ok'] else "FAIL"
+        line = f"[{done}/{total}] {state} {result['path']}"
+        if result['error']:
+            line += f" ({result['error']})"
+        print(line)
+
+    def run(self, prefix="", include=(), exclude=(), with_media=True, follow_links=0):
+        """
+        Mirrors notes under prefix, plus the notes they link to up to follow_links hops away,
+        and (optionally) their media; returns all download results.
+        """
+        cache_data = self.scraper.cache_data
+        if cache_data is None:
+            cache_data = self.scraper.get_directory()
+
+        notes, files = select_paths(cache_data, prefix, include, exclude)
+        graph = self.scraper.link_graph
+        if follow_links:
+            linked = graph.closure(notes, follow_links)
+            notes = [p for p in linked if p.endswith('.md') and matches(p, include, exclude)]
+        # Hub notes and what they link to first, so an interrupted run keeps the best-connected part
+        notes = graph.crawl_order(notes)
+        print(f"Mirroring {len(notes)} notes and {len(files)} other files into {self.output}")
+
+        results = self.engine.run(self._items(notes), self.output, self._report)
+        self.transferred += self.engine.progress.transferred()
+        if not with_media:
+            return results
+
+        # Media referenced by the notes may live outside the prefix (e.g. a shared file/ folder)
+        media = set(files)
+        for path in notes:
+            for item in self.scraper.extract_media(read_local_note(self.output, path), path):
+                if matches(item['path'], include, exclude):
+                    media.add(item['path'])
+
+        print(f"Downloading {len(media)} media and attachment files")
+        results += self.engine.run(self._items(sorted(media)), self.output, self._report)
+        self.transferred += self.engine.progress.transferred()
+        return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror Haokee Note into a local folder without the GUI.")
+    parser.add_argument('-o', '--output', required=True, help="destination directory")
+    parser.add_argument('-p', '--prefix', default="", help="only mirror this vault folder, e.g. 歌曲 or 软件/编辑器")
+    parser.add_argument('-j', '--concurrency', type=int, default=8, help="parallel downloads (default: 8)")
+    parser.add_argument('-i', '--include', action='append', default=[], metavar='GLOB',
+                        help="only vault paths matching this glob (repeatable)")
+    parser.add_argument('-x', '--exclude', action='append', default=[], metavar='GLOB',
+                        help="skip vault paths matching this glob (repeatable)")
+    parser.add_argument('-l', '--follow-links', type=int, default=0, metavar='DEPTH',
+                        help="also mirror notes linked from the selection, up to DEPTH hops away")
+    parser.add_argument('--no-media', action='store_true', help="download notes only")
+    parser.add_argument('--check-remote', action='store_true',
+                        help="confirm unchanged files with a HEAD request instead of trusting the manifest")
+    parser.add_argument('--limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help="total bandwidth cap, e.g. 500K or 2M bytes per second")
+    parser.add_argument('--host-limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help="bandwidth cap per host")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    scraper = HaokeeScraper(pool_size=max(args.concurrency, 4))
+    mirror = Mirror(scraper, args.output, concurrency=args.concurrency,
+                    check_remote=args.check_remote, verbose=not args.quiet,
+                    max_rate=args.limit_rate, per_host_rate=args.host_limit_rate)
+    started = time.monotonic()
+    results = mirror.run(args.prefix, args.include, args.exclude, with_media=not args.no_media,
+                         follow_links=args.follow_links)
+
+    failed = [r for r in results if not r['ok']]
+    skipped = sum(1 for r in results if r['skipped'])
+    print(f"Done: {len(results) - len(failed) - skipped} downloaded, {skipped} unchanged, {len(failed)} failed.")
+    elapsed = time.monotonic() - started
+    print(f"Transferred {format_bytes(mirror.transferred)} in {elapsed:.1f}s "
+          f"({format_bytes(mirror.transferred / elapsed if elapsed > 0 else 0)}/s).")
+    print(f"Transport: {scraper.transport.stats()}")
+    for r in failed:
+        print(f"  {r['path']}: {r['error']}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
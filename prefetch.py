@@ -0,0 +1,96 @@
+import posixpath
+import threading
+
+class Prefetcher:
+    """
+    Warms scraper.memory_cache with the notes a reader is likely to open next: the ones
+    the current note links to, then its neighbours in the folder (in tree order).
+    Runs on a single background thread and pauses whenever the transport is busy:
+    a foreground fetch (the note the user clicked) or a bulk transfer (a download).
+    """
+
+    def __init__(self, scraper, budget=8, pause=0.2):
+        self.scraper = scraper
+        self.budget = budget # Notes fetched ahead per opened note
+        self.pause = pause # Seconds between checks while the transport is busy
+        self.fetched = 0
+        self._queue = []
+        self._generation = 0 # Bumped by schedule(), so a superseded plan is dropped
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._siblings = {} # folder -> its notes sorted like the tree
+        self._siblings_source = None
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._queue = []
+            self._cond.notify()
+
+    def siblings(self, path):
+        cache_data = self.scraper.cache_data or {}
+        if cache_data is not self._siblings_source:
+            # Directory was (re)loaded
+            self._siblings = {}
+            self._siblings_source = cache_data
+        folder = posixpath.dirname(path)
+        if folder not in self._siblings:
+            notes = [p for p in cache_data if p.endswith('.md') and posixpath.dirname(p) == folder]
+            notes.sort(key=lambda p: posixpath.basename(p).lower())
+            self._siblings[folder] = notes
+        return self._siblings[folder]
+
+    def candidates(self, path):
+        """Notes to fetch after path, most likely first, skipping ones already in memory."""
+        linked = [p for p in self.scraper.link_graph.links_from(path) if p.endswith('.md')]
+        siblings = self.siblings(path)
+        pos = siblings.index(path) if path in siblings else 0
+        # Readers mostly move down the list, so the following notes come before the previous ones
+        neighbours = siblings[pos + 1:] + siblings[:pos][::-1]
+
+        plan = []
+        for candidate in linked + neighbours:
+            if len(plan) >= self.budget:
+                break
+            if candidate != path and candidate not in plan and candidate not in self.scraper.memory_cache:
+                plan.append(candidate)
+        return plan
+
+    def schedule(self, path):
+        """Replaces whatever was still queued with the plan for the newly opened note."""
+        plan = self.candidates(path)
+        with self._cond:
+            self._queue = plan
+            self._generation += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._queue:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                path = self._queue.pop(0)
+                generation = self._generation
+
+            # Never compete with what the user is waiting on
+            while self.scraper.transport.is_busy():
+                with self._cond:
+                    if self._stopped:
+                        return
+                    self._cond.wait(self.pause)
+
+            if generation != self._generation or path in self.scraper.memory_cache:
+                continue
+            try:
+                body = self.scraper.get_page_content(path, background=True)
+            except Exception:
+                continue # Just a guess that didn't pan out; the user's own fetch will report errors
+            self.scraper.memory_cache.put(path, body)
+            self.fetched += 1
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+class TransferProgress:
+    """
+    Byte-level progress of a batch: per-file received / expected bytes, totals, throughput
+    over a rolling window and an ETA. Updated from download workers, read from anywhere.
+
+    Files whose size isn't known yet (no HEAD probe, transfer not started) are counted at
+    the average size of the known ones, so the total doesn't jump when they start.
+    """
+
+    def __init__(self, file_count=0, window=5.0):
+        self.file_count = file_count
+        self.window = window
+        self.files = {} # url -> {'name', 'received', 'expected', 'state'}
+        self.started = time.monotonic()
+        self._samples = deque() # (time, total bytes received) for the rolling rate
+        self._received = 0 # Bytes transferred in this batch (not counting resumed or skipped ones)
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+
+    def _file(self, url, name=None):
+        entry = self.files.get(url)
+        if entry is None:
+            entry = self.files[url] = {'name': name or url.rsplit('/', 1)[-1], 'received': 0,
+                                       'expected': None, 'state': 'waiting'}
+        return entry
+
+    def expect(self, url, name, size):
+        """Size learned ahead of the transfer (HEAD probe or manifest); ignored once it started."""
+        with self._lock:
+            entry = self._file(url, name)
+            if entry['state'] == 'waiting':
+                entry['expected'] = size
+
+    def start_file(self, url, name, expected=None, offset=0):
+        """The transfer began; offset bytes were already on disk (resumed)."""
+        with self._lock:
+            entry = self._file(url, name)
+            entry['received'] = offset
+            if expected is not None:
+                entry['expected'] = expected
+            entry['state'] = 'active'
+
+    def advance(self, url, amount):
+        with self._lock:
+            self.files[url]['received'] += amount
+            self._received += amount
+            now = time.monotonic()
+            self._samples.append((now, self._received))
+            while self._samples and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+
+    def waiting(self, url):
+        """True until the file's transfer starts (or it is skipped)."""
+        with self._lock:
+            entry = self.files.get(url)
+            return entry is None or entry['state'] == 'waiting'
+
+    def finish_file(self, url, name, ok, size=None):
+        with self._lock:
+            entry = self._file(url, name)
+            if size is not None:
+                entry['received'] = size
+            # A failed file counts as what it got, so it neither stays an estimate nor
+            # holds the total open with bytes that will never come
+            entry['expected'] = entry['received']
+            entry['state'] = 'done' if ok else 'failed'
+
+    def transferred(self):
+        """Bytes actually received over the network in this batch."""
+        with self._lock:
+            return self._received
+
+    def rate(self):
+        """Bytes per second over the rolling window."""
+        with self._lock:
+            return self._rate_locked()
+
+    def _rate_locked(self):
+        if len(self._samples) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        # Idle since the last chunk counts too, so a stalled transfer shows its rate falling
+        elapsed = max(t1, time.monotonic()) - t0
+        return (b1 - b0) / elapsed if elapsed > 0 else 0.0
+
+    def due(self, interval=0.1):
+        """True at most once per interval: lets chunk-level callers throttle UI updates."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_emit < interval:
+                return False
+            self._last_emit = now
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            known = [f['expected'] for f in self.files.values() if f['expected'] is not None]
+            average = sum(known) / len(known) if known else 0
+            unknown = max(self.file_count - len(known), 0)
+            total = sum(known) + average * unknown
+            done = sum(min(f['received'], f['expected'] or f['received']) for f in self.files.values())
+            rate = self._rate_locked()
+            remaining = max(total - done, 0)
+            active = [{'name': f['name'], 'received': f['received'], 'expected': f['expected']}
+                      for f in self.files.values() if f['state'] == 'active']
+            return {
+                'done_bytes': done,
+                'total_bytes': total,
+                'exact': unknown == 0,
+                'fraction': min(done / total, 1.0) if total else 0.0,
+                'rate': rate,
+                'eta': remaining / rate if rate > 0 else None,
+                'files_done': sum(1 for f in self.files.values() if f['state'] in ('done', 'failed')),
+                'file_count': self.file_count,
+                'active': active,
+            }
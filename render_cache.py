@@ -0,0 +1,54 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import markdown
+
+DEFAULT_EXTENSIONS = ('extra', 'nl2br', 'codehilite')
+
+class MarkdownRenderer:
+    """
+    Markdown -> HTML with an LRU of rendered results keyed by content hash and extension set,
+    so showing a note again skips the (codehilite-heavy) render. Safe to call from worker
+    threads; every render's duration is kept so slow notes can be found.
+    """
+
+    def __init__(self, extensions=DEFAULT_EXTENSIONS, max_entries=128):
+        self.extensions = list(extensions)
+        self.max_entries = max_entries
+        self.timings = {} # note path -> milliseconds of its last actual render
+        self._cache = OrderedDict() # key -> html
+        self._lock = threading.Lock()
+
+    def _key(self, content):
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        return f"{digest}:{','.join(sorted(self.extensions))}"
+
+    def render(self, content, path=None):
+        """Returns (html, milliseconds spent, came from cache)."""
+        key = self._key(content)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                return html, 0.0, True
+
+        start = time.perf_counter()
+        # markdown.markdown builds a fresh Markdown instance, so concurrent renders don't share state
+        html = markdown.markdown(content, extensions=self.extensions)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"Rendered {path or 'markdown'} in {elapsed:.1f} ms")
+
+        with self._lock:
+            self._cache[key] = html
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            if path:
+                self.timings[path] = elapsed
+        return html, elapsed, False
+
+    def slowest(self, n=10):
+        """[(path, ms)] of the slowest renders seen so far."""
+        with self._lock:
+            return sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:n]
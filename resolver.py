@@ -0,0 +1,86 @@
+import posixpath
+
+def _strip_extension(name):
+    return name.rsplit('.', 1)[0] if '.' in name else name
+
+class LinkResolver:
+    """
+    Resolves Obsidian link targets ("pic.png", "Zed", "编辑器/Zed", "../file/a.png") to vault paths.
+
+    Built once per directory load: every path is indexed under each of its path
+    suffixes ("a/b/c.png", "b/c.png", "c.png"), and also without the extension,
+    so one lookup finds every candidate. Keys are case-insensitive like Obsidian's.
+    """
+
+    def __init__(self, paths):
+        self.paths = set(paths)
+        self._exact = {} # lowercased path -> path
+        self._suffixes = {} # lowercased suffix -> [paths], shortest path first
+        for path in self.paths:
+            self._exact.setdefault(path.lower(), path)
+            parts = path.split('/')
+            stem = _strip_extension(parts[-1])
+            for k in range(1, len(parts) + 1):
+                suffix = parts[-k:]
+                self._suffixes.setdefault('/'.join(suffix).lower(), []).append(path)
+                if stem != parts[-1]:
+                    key = '/'.join(suffix[:-1] + [stem]).lower()
+                    self._suffixes.setdefault(key, []).append(path)
+
+        for candidates in self._suffixes.values():
+            candidates.sort(key=lambda p: (p.count('/'), len(p), p))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _lookup(self, path):
+        """Exact vault path, with or without the implicit .md."""
+        found = self._exact.get(path.lower())
+        if found is None and not path.lower().endswith('.md'):
+            found = self._exact.get(path.lower() + '.md')
+        return found
+
+    def resolve(self, link, source=None):
+        """Returns the vault path link points to when written in note source, or None."""
+        # "name|alias", "name#heading" and "name#^block" all point at name
+        link = link.split('|')[0].split('#')[0].strip()
+        if not link:
+            return None
+        source_folder = posixpath.dirname(source) if source else ''
+
+        # Explicit relative links ("./a.png", "../file/a.png")
+        if link.startswith('./') or link.startswith('../'):
+            path = posixpath.normpath(posixpath.join(source_folder, link))
+            return self._lookup(path)
+
+        link = link.lstrip('/')
+
+        # Full path from the vault root
+        found = self._lookup(link)
+        if found:
+            return found
+
+        # Same folder as the linking note
+        if source_folder:
+            found = self._lookup(f"{source_folder}/{link}")
+            if found:
+                return found
+
+        candidates = self._suffixes.get(link.lower())
+        if not candidates:
+            return None
+        if len(candidates) == 1 or not source_folder:
+            return candidates[0]
+
+        # Ambiguous name: prefer the candidate nearest to the note, then the shortest path
+        source_parts = source_folder.split('/')
+
+        def shared_folders(path):
+            shared = 0
+            for a, b in zip(path.split('/')[:-1], source_parts):
+                if a != b:
+                    break
+                shared += 1
+            return shared
+
+        return max(candidates, key=shared_folders)
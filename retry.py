@@ -0,0 +1,81 @@
+import email.utils
+import random
+import threading
+import time
+
+class CircuitOpen(IOError):
+    """Raised instead of sending a request to a host that keeps failing."""
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a request: exponential backoff with full
+    jitter, or the server's Retry-After when it sends one (up to max_delay).
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, attempts=3, base=0.5, cap=8.0, max_delay=30.0):
+        self.attempts = attempts # Retries after the first try
+        self.base = base
+        self.cap = cap
+        self.max_delay = max_delay
+
+    def retry_after(self, response):
+        """Seconds the server asked us to wait, or None."""
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(when.timestamp() - time.time(), 0.0)
+
+    def delay(self, attempt, response=None):
+        """Wait before retry number attempt (0-based); None if the server wants longer than max_delay."""
+        requested = self.retry_after(response)
+        if requested is not None:
+            return requested if requested <= self.max_delay else None
+        # Full jitter keeps many workers that failed together from retrying in lockstep
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Per-host failure gate. After threshold consecutive failures the circuit opens and
+    requests fail at once for cooldown seconds; then one trial request is let through,
+    and its outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._trial:
+                raise CircuitOpen(f"{host} is failing, not retrying for {max(remaining, 0):.0f}s")
+            # Half-open: this request is the trial
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
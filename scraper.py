@@ -1,40 +1,211 @@
-import requests
 import json
+import os
 import re
+from contextlib import nullcontext
 from urllib.parse import quote
 from bs4 import BeautifulSoup
 
-class HaokeeScraper:
+from transport import HttpTransport
+from content_cache import ContentCache, MemoryCache
+from appdata import data_dir
+from resolver import LinkResolver
+from media_extractor import extract_links
+from vault_index import MetadataIndex, LinkGraph
+
+BASE_URL = "https://haokee-note.org/%E4%B8%BB%E9%A1%B5"
+
+class FetchCancelled(Exception):
+    pass
+
+class BaseScraper:
+    """Network-independent parsing shared by the blocking and asyncio scrapers."""
+
     def __init__(self):
-        self.base_url = "https://haokee-note.org/%E4%B8%BB%E9%A1%B5"
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.base_url = BASE_URL
         self.site_info = None
         self.cache_data = None
-        self.file_map = {} # Map filename to full path
+        self.resolver = LinkResolver([]) # Obsidian-style link lookup over every vault path
+        self.media_index = {} # Map note path to the media paths it embeds (from cache metadata)
+        self.metadata_index = MetadataIndex({}) # Tags and headings (from cache metadata)
+        self.link_graph = LinkGraph({}, self.resolver.resolve) # Links between notes (from cache metadata)
+
+    def parse_site_info(self, html):
+        """Extracts window.siteInfo from the home page HTML."""
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Find script containing window.siteInfo
+        for script in soup.find_all('script'):
+            if script.string and 'window.siteInfo=' in script.string:
+                # Extract JSON object
+                match = re.search(r'window\.siteInfo=(.*?);', script.string)
+                if match:
+                    json_str = match.group(1)
+                    self.site_info = json.loads(json_str)
+                    print(f"Site Info found: {self.site_info['uid']} @ {self.site_info['host']}")
+                    return self.site_info
+        
+        raise ValueError("Could not find window.siteInfo in home page")
+
+    def load_directory(self, cache_data):
+        """Stores the directory cache and rebuilds the lookup tables derived from it."""
+        # Built aside and swapped in, since GUI threads may be resolving paths meanwhile
+        self.resolver = LinkResolver(cache_data.keys())
+        self.cache_data = cache_data
+        self.media_index = self.build_media_index(cache_data)
+        self.metadata_index = MetadataIndex(cache_data)
+        self.link_graph = LinkGraph(cache_data, self.resolve_path)
+        return self.cache_data
+
+    def build_media_index(self, cache_data):
+        """Maps each note to the media it embeds, using the 'embeds' metadata so no note body is needed."""
+        media_index = {}
+        for path, meta in cache_data.items():
+            if not meta or not meta.get('embeds'):
+                continue
+            media_paths = []
+            for embed in meta['embeds']:
+                # Links look like "pic.png", "pic.png|300" or "pic.png#pic_center"; the resolver strips the suffix
+                full_path = self.resolve_path(embed.get('link', ''), path)
+                # Embedded notes aren't media
+                if full_path and not full_path.endswith('.md') and full_path not in media_paths:
+                    media_paths.append(full_path)
+            if media_paths:
+                media_index[path] = media_paths
+        return media_index
+
+    def media_entry(self, full_path, name=None):
+        name = name or full_path.split('/')[-1]
+        return {
+            'name': name,
+            'path': full_path,
+            'url': self.construct_url(full_path),
+            'type': self.get_file_type(name)
+        }
+
+    def get_note_media(self, note_path):
+        """Media embedded by one note, straight from the directory metadata."""
+        return [self.media_entry(p) for p in self.media_index.get(note_path, [])]
+
+    def get_folder_media(self, folder):
+        """Media embedded by every note under folder, without fetching any note."""
+        prefix = folder.rstrip('/') + '/'
+        seen = set()
+        media = []
+        for note_path, media_paths in self.media_index.items():
+            if not note_path.startswith(prefix):
+                continue
+            for full_path in media_paths:
+                if full_path not in seen:
+                    seen.add(full_path)
+                    media.append(self.media_entry(full_path))
+        return media
+
+    def get_linked_items(self, note_path, depth=1):
+        """
+        Download items for note_path, the notes it links to (depth hops out) and the media
+        all of them embed. Items carry their vault path as 'target', so names can't collide.
+        """
+        items = []
+        seen = set()
+        for path in self.link_graph.closure(note_path, depth):
+            for full_path in [path] + self.media_index.get(path, []):
+                if full_path not in seen:
+                    seen.add(full_path)
+                    item = self.media_entry(full_path)
+                    item['target'] = full_path
+                    items.append(item)
+        return items
+
+    def cache_url(self):
+        return f"https://{self.site_info['host']}/cache/{self.site_info['uid']}"
+
+    def extract_media(self, content, source=None):
+        """Parses markdown content and extracts media URLs. source is the note's own path, for relative links."""
+        media_files = []
+        seen = set()
+        # Wiki embeds, standard image links and <img>/<audio>/<video> tags in one pass
+        for link in extract_links(content):
+            full_path = self.resolve_path(link, source)
+            # Embedded notes aren't media; different spellings of one file download once
+            if full_path and not full_path.endswith('.md') and full_path not in seen:
+                seen.add(full_path)
+                media_files.append(self.media_entry(full_path))
+                    
+        return media_files
+
+    def resolve_path(self, link, source=None):
+        """Finds the full path in cache for a link written in note source (Obsidian rules)."""
+        return self.resolver.resolve(link, source)
+
+    def construct_url(self, full_path):
+        # Path needs to be URL encoded, but slash should not be encoded if it separates folders
+        # Example: .../access/uid/%E6%AD%8C%E6%9B%B2/%E7%BA%AF...md
+        uid = self.site_info['uid']
+        host = self.site_info['host']
+        encoded_path = "/".join([quote(part) for part in full_path.split('/')])
+        return f"https://{host}/access/{uid}/{encoded_path}"
+
+    def get_file_type(self, filename):
+        ext = filename.split('.')[-1].lower()
+        if ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
+            return 'image'
+        elif ext in ['mp3', 'wav', 'ogg', 'm4a']:
+            return 'audio'
+        elif ext in ['mp4', 'webm', 'mov']:
+            return 'video'
+        return 'unknown'
+
+class HaokeeScraper(BaseScraper):
+    def __init__(self, transport=None, pool_size=16, timeout=(10, 30), content_cache=None, memory_cache=None):
+        super().__init__()
+        # One keep-alive session for every request made on behalf of this scraper,
+        # including downloads running on worker threads.
+        self.transport = transport or HttpTransport(pool_size=pool_size, timeout=timeout)
+        self.headers = self.transport.headers
+        self.content_cache = content_cache if content_cache is not None else ContentCache()
+        # Notes just read or prefetched, served without a round trip
+        self.memory_cache = memory_cache if memory_cache is not None else MemoryCache()
+        self.snapshot_path = os.path.join(data_dir(), "directory_snapshot.json")
+
+    def load_snapshot(self):
+        """Restores siteInfo and the directory from the last saved snapshot. Returns True on success."""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            site_info = snapshot['site_info']
+            cache_data = snapshot['cache_data']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No usable directory snapshot: {e}")
+            return False
+
+        self.site_info = site_info
+        self.load_directory(cache_data)
+        print(f"Loaded directory snapshot with {len(cache_data)} entries.")
+        return True
+
+    def save_snapshot(self):
+        """Persists the current siteInfo and directory. Returns True if they differ from the saved copy."""
+        snapshot = {'site_info': self.site_info, 'cache_data': self.cache_data}
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                if json.load(f) == snapshot:
+                    return False
+        except (OSError, ValueError):
+            pass
+
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, self.snapshot_path)
+        return True
 
     def get_site_info(self):
         """Fetches the home page and extracts siteInfo."""
         print(f"Fetching site info from {self.base_url}...")
         try:
-            resp = requests.get(self.base_url, headers=self.headers)
+            resp = self.transport.get(self.base_url)
             resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            
-            # Find script containing window.siteInfo
-            for script in soup.find_all('script'):
-                if script.string and 'window.siteInfo=' in script.string:
-                    # Extract JSON object
-                    match = re.search(r'window\.siteInfo=(.*?);', script.string)
-                    if match:
-                        json_str = match.group(1)
-                        self.site_info = json.loads(json_str)
-                        print(f"Site Info found: {self.site_info['uid']} @ {self.site_info['host']}")
-                        return self.site_info
-            
-            raise ValueError("Could not find window.siteInfo in home page")
-            
+            return self.parse_site_info(resp.text)
         except Exception as e:
             print(f"Error getting site info: {e}")
             raise
@@ -44,131 +215,91 @@ class HaokeeScraper:
         if not self.site_info:
             self.get_site_info()
             
-        uid = self.site_info['uid']
-        host = self.site_info['host']
-        cache_url = f"https://{host}/cache/{uid}"
+        cache_url = self.cache_url()
         
         print(f"Fetching directory from {cache_url}...")
         try:
-            resp = requests.get(cache_url, headers=self.headers)
+            resp = self.transport.get(cache_url)
             resp.raise_for_status()
-            self.cache_data = resp.json()
-            
-            # Build file map for easier lookup (filename -> full path)
-            self.file_map = {}
-            for full_path in self.cache_data.keys():
-                filename = full_path.split('/')[-1]
-                # If duplicates exist, this simplistic map might overwrite, 
-                # but usually media files have unique names or we can handle it better if needed.
-                self.file_map[filename] = full_path
-                
-            return self.cache_data
+            return self.load_directory(resp.json())
         except Exception as e:
             print(f"Error fetching directory: {e}")
             raise
 
-    def get_page_content(self, path):
-        """Fetches the markdown content of a page."""
+    def get_page_content(self, path, background=False, cancel=None):
+        """
+        Fetches the markdown content of a page. background fetches (prefetching, indexing)
+        don't count as foreground work and don't fill the memory cache. Setting the
+        cancel event (a threading.Event) aborts the download and raises FetchCancelled.
+        Raises on failure, unless the server is unreachable and a cached copy exists.
+        """
+        body = self.memory_cache.get(path)
+        if body is not None:
+            return body
+        if cancel is not None and cancel.is_set():
+            raise FetchCancelled()
+
         if not self.site_info:
             self.get_site_info()
             
-        uid = self.site_info['uid']
-        host = self.site_info['host']
-        
-        # Path needs to be URL encoded
-        # split by / and encode each part to be safe, or just quote the whole thing?
-        # Requests usually handles some encoding, but the URL format is specific.
-        # Example: .../access/uid/%E6%AD%8C%E6%9B%B2/%E7%BA%AF...md
-        
-        encoded_path = quote(path)
-        # However, slash should not be encoded if it separates folders
-        encoded_path = "/".join([quote(part) for part in path.split('/')])
+        content_url = self.construct_url(path)
         
-        content_url = f"https://{host}/access/{uid}/{encoded_path}"
+        # Revalidate our cached copy instead of downloading the body again
+        headers = self.content_cache.conditional_headers(path)
         
         print(f"Fetching content from {content_url}...")
         try:
-            resp = requests.get(content_url, headers=self.headers)
-            resp.raise_for_status()
-            return resp.text
+            with (nullcontext() if background else self.transport.foreground()):
+                body = self._fetch_page(path, content_url, headers, cancel)
+            if not background:
+                self.memory_cache.put(path, body)
+            return body
+        except FetchCancelled:
+            print(f"Cancelled: {content_url}")
+            raise
         except Exception as e:
+            if cancel is not None and cancel.is_set():
+                # Gave up during a retry backoff
+                print(f"Cancelled: {content_url}")
+                raise FetchCancelled()
             print(f"Error fetching content: {e}")
-            return None
-
-    def extract_media(self, content):
-        """Parses markdown content and extracts media URLs."""
-        if not content:
-            return []
-            
-        media_files = []
-        
-        # Regex for Obsidian Wiki Links: ![[filename.ext]]
-        wiki_links = re.findall(r'!\[\[(.*?)\]\]', content)
-        for link in wiki_links:
-            # Link might have pipe for alt text: ![[filename.png|alt]]
-            filename = link.split('|')[0]
-            full_path = self.resolve_path(filename)
-            if full_path:
-                media_files.append({
-                    'name': filename,
-                    'path': full_path,
-                    'url': self.construct_url(full_path),
-                    'type': self.get_file_type(filename)
-                })
-
-        # Regex for Standard Markdown: ![alt](filename.ext)
-        md_links = re.findall(r'!\[.*?\]\((.*?)\)', content)
-        for link in md_links:
-            # Link might be a full URL or relative path
-            if link.startswith('http'):
-                # External image, maybe skip or include? 
-                # User asked for "media files ... in the folder", implying hosted ones.
-                # But let's include them if they seem relevant.
-                # For now, focus on internal ones.
-                pass
-            else:
-                # Relative path or filename
-                # If it has encoded chars, unquote it
-                from urllib.parse import unquote
-                filename = unquote(link.split('/')[-1])
-                full_path = self.resolve_path(filename)
-                if full_path:
-                    media_files.append({
-                        'name': filename,
-                        'path': full_path,
-                        'url': self.construct_url(full_path),
-                        'type': self.get_file_type(filename)
-                    })
-                    
-        return media_files
+            response = getattr(e, 'response', None)
+            if response is None or response.status_code >= 500:
+                # Server down or unreachable (retries already spent): a stale copy beats nothing
+                body = self.content_cache.get(path)
+                if body is not None:
+                    print(f"Serving cached copy of {path}")
+                    return body
+            raise
 
-    def resolve_path(self, filename):
-        """Finds the full path in cache for a given filename."""
-        # Check exact match first
-        if filename in self.cache_data:
-            return filename
-            
-        # Check file map
-        if filename in self.file_map:
-            return self.file_map[filename]
-            
-        return None
+    def _fetch_page(self, path, content_url, headers, cancel=None):
+        # Streamed responses hold a pooled connection until closed, errors included
+        with self.transport.get(content_url, headers=headers, stream=True, cancel=cancel) as resp:
+            if resp.status_code != 304:
+                return self._store_page(path, resp, cancel)
+        body = self.content_cache.get(path)
+        if body is not None:
+            return body
+        # Cache entry disappeared under us, fetch unconditionally
+        with self.transport.get(content_url, stream=True, cancel=cancel) as resp:
+            return self._store_page(path, resp, cancel)
 
-    def construct_url(self, full_path):
-        uid = self.site_info['uid']
-        host = self.site_info['host']
-        encoded_path = "/".join([quote(part) for part in full_path.split('/')])
-        return f"https://{host}/access/{uid}/{encoded_path}"
+    def _store_page(self, path, resp, cancel=None):
+        resp.raise_for_status()
+        body = self._read_text(resp, cancel)
+        self.content_cache.put(path, body, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        return body
 
-    def get_file_type(self, filename):
-        ext = filename.split('.')[-1].lower()
-        if ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'svg']:
-            return 'image'
-        elif ext in ['mp3', 'wav', 'ogg', 'm4a']:
-            return 'audio'
-        elif ext in ['mp4', 'webm', 'mov']:
-            return 'video'
-        return 'unknown'
+    def _read_text(self, resp, cancel=None):
+        """Reads a streamed body in chunks so a cancelled fetch stops using bandwidth right away."""
+        chunks = []
+        for chunk in resp.iter_content(16 * 1024):
+            if cancel is not None and cancel.is_set():
+                # Closing drops the connection instead of draining the rest of the body
+                resp.close()
+                raise FetchCancelled()
+            chunks.append(chunk)
+        return b''.join(chunks).decode(resp.encoding or 'utf-8', errors='replace')
 
 if __name__ == "__main__":
     # Test
@@ -177,7 +308,9 @@ if __name__ == "__main__":
     print("Directory fetched.")
     content = scraper.get_page_content("歌曲/纯爱战士祝睿融.md")
     if content:
-        media = scraper.extract_media(content)
+        media = scraper.extract_media(content, "歌曲/纯爱战士祝睿融.md")
         print("Found media:")
         for m in media:
             print(m)
+    print(f"Transport: {scraper.transport.stats()}")
+    print(f"Content cache: {scraper.content_cache.stats()}")
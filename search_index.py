@@ -0,0 +1,229 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+
+from appdata import data_dir
+
+# Chinese has no spaces, so CJK runs are indexed as overlapping character bigrams
+# (plus single characters so one-character queries still work); everything else as words.
+_TOKEN_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9_]+')
+_CJK = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+TITLE_WEIGHT = 5 # Title terms count as this many occurrences in the body
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_RUN.findall(text.lower()):
+        if _CJK.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+def title_of(path):
+    name = path.split('/')[-1]
+    return name[:-3] if name.endswith('.md') else name
+
+class SearchIndex:
+    """
+    Persistent inverted index over note bodies with BM25 ranking.
+    update() only re-tokenizes notes whose text changed. Note text itself isn't stored;
+    snippets come from text_source(path) (e.g. the content cache), if one is given.
+    """
+
+    def __init__(self, path=None, text_source=None):
+        self.path = path or os.path.join(data_dir(), "search_index.json")
+        self.text_source = text_source
+        self.docs = {} # note path -> {'hash', 'length'}
+        self.postings = {} # term -> {note path: weighted term frequency}
+        self._doc_terms = {} # note path -> its terms; derived from postings, not saved
+        self._vocabulary = [] # Sorted word terms for prefix matching, kept up to date on every change
+        self._total_length = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            docs, postings = data['docs'], data['postings']
+        except (OSError, ValueError, KeyError):
+            return False
+        for doc in docs.values():
+            # Index files from before text was dropped
+            doc.pop('text', None)
+        doc_terms = {path: [] for path in docs}
+        for term, entries in postings.items():
+            for path in entries:
+                doc_terms[path].append(term)
+        with self._lock:
+            self.docs = docs
+            self.postings = postings
+            self._doc_terms = doc_terms
+            self._total_length = sum(doc['length'] for doc in docs.values())
+            self._vocabulary = sorted(t for t in postings if not _CJK.match(t))
+        return True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'docs': self.docs, 'postings': self.postings}, ensure_ascii=False)
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def _term_counts(self, path, text):
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        for token in tokenize(title_of(path)):
+            counts[token] = counts.get(token, 0) + TITLE_WEIGHT
+        return counts
+
+    def _add_term_locked(self, term):
+        self.postings[term] = {}
+        if not _CJK.match(term):
+            bisect.insort(self._vocabulary, term)
+
+    def _drop_term_locked(self, term):
+        del self.postings[term]
+        if not _CJK.match(term):
+            i = bisect.bisect_left(self._vocabulary, term)
+            if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                del self._vocabulary[i]
+
+    def _remove_locked(self, path):
+        doc = self.docs.pop(path, None)
+        if doc is None:
+            return
+        for term in self._doc_terms.pop(path, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(path, None)
+                if not postings:
+                    self._drop_term_locked(term)
+        self._total_length -= doc['length']
+        self._dirty = True
+
+    def update(self, path, text):
+        """Indexes (or re-indexes) one note. Returns False if its text is unchanged."""
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            doc = self.docs.get(path)
+            if doc is not None and doc['hash'] == digest:
+                return False
+        # Tokenize outside the lock so searches aren't held up
+        counts = self._term_counts(path, text)
+        length = sum(counts.values())
+        with self._lock:
+            self._remove_locked(path)
+            for term, count in counts.items():
+                if term not in self.postings:
+                    self._add_term_locked(term)
+                self.postings[term][path] = count
+            self.docs[path] = {'hash': digest, 'length': length}
+            self._doc_terms[path] = list(counts)
+            self._total_length += length
+            self._dirty = True
+        return True
+
+    def remove(self, path):
+        with self._lock:
+            self._remove_locked(path)
+
+    def prune(self, valid_paths):
+        """Drops notes that no longer exist in the vault."""
+        valid_paths = set(valid_paths)
+        with self._lock:
+            for path in [p for p in self.docs if p not in valid_paths]:
+                self._remove_locked(path)
+
+    def _expand_prefix(self, term, limit=50):
+        # Only word terms are prefix-matched, which keeps the sorted vocabulary small
+        start = bisect.bisect_left(self._vocabulary, term)
+        matches = []
+        for candidate in self._vocabulary[start:start + limit]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, query, limit=30):
+        """Returns [(path, score, snippet)] ranked by BM25; every query term must match."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        # While typing, the last word is probably incomplete: match it as a prefix
+        last = terms[-1]
+        prefix_last = not _CJK.match(last) and not query.endswith(' ')
+
+        k1, b = 1.2, 0.75
+        with self._lock:
+            n = len(self.docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+
+            groups = []
+            for i, term in enumerate(terms):
+                variants = self._expand_prefix(term) if prefix_last and i == len(terms) - 1 else [term]
+                postings = [self.postings[v] for v in variants if v in self.postings]
+                if not postings:
+                    return []
+                groups.append(postings)
+
+            # Intersect starting from the rarest term
+            groups.sort(key=lambda group: sum(len(p) for p in group))
+            candidates = None
+            for group in groups:
+                paths = set().union(*group)
+                candidates = paths if candidates is None else candidates & paths
+                if not candidates:
+                    return []
+
+            scores = {}
+            for group in groups:
+                for postings in group:
+                    idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for path in candidates:
+                        tf = postings.get(path)
+                        if not tf:
+                            continue
+                        norm = tf + k1 * (1 - b + b * self.docs[path]['length'] / avg_length)
+                        scores[path] = scores.get(path, 0.0) + idf * tf * (k1 + 1) / norm
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        # Snippet text is read outside the lock; it may come from disk
+        return [(path, score, self.snippet(self._text(path), query)) for path, score in top]
+
+    def _text(self, path):
+        text = self.text_source(path) if self.text_source else None
+        return text or ""
+
+    def snippet(self, text, query, width=40):
+        """A short single-line excerpt around the first hit of the query (or of its first word)."""
+        lowered = text.lower()
+        pos = lowered.find(query.strip().lower())
+        if pos < 0:
+            for term in tokenize(query):
+                pos = lowered.find(term)
+                if pos >= 0:
+                    break
+        if pos < 0:
+            pos = 0
+        start = max(pos - width, 0)
+        excerpt = ' '.join(text[start:pos + width * 2].split())
+        return ("…" if start else "") + excerpt + ("…" if pos + width * 2 < len(text) else "")
@@ -0,0 +1,305 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+from appdata import data_dir
+from downloader import save_part_meta
+
+class RangeCache:
+    """
+    Sparse local copy of one remote file, filled block by block with HTTP Range requests.
+    Reads fetch only the blocks they touch (plus a little read-ahead), so playback can
+    start, and seeks can land, without downloading the whole file.
+    """
+
+    def __init__(self, transport, url, path, block_size=256 * 1024, read_ahead=2):
+        self.transport = transport
+        self.url = url
+        self.path = path
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.size = None
+        self.etag = None
+        self.last_modified = None
+        self.content_type = None
+        self.fetched_bytes = 0
+        self._blocks = set() # Indexes of blocks present in the local file
+        self._lock = threading.RLock()
+        open(self.path, 'wb').close()
+
+    def _block_count(self):
+        return (self.size + self.block_size - 1) // self.block_size
+
+    def _fetch(self, first, last):
+        """Fetches blocks first..last in a single request."""
+        start = first * self.block_size
+        end = (last + 1) * self.block_size - 1
+        if self.size is not None:
+            end = min(end, self.size - 1)
+        headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={start}-{end}"}
+        validator = self.etag or self.last_modified
+        if validator:
+            # If the file changed since we started, the server sends all of it instead
+            headers['If-Range'] = validator
+
+        with self.transport.get(self.url, stream=True, headers=headers) as resp:
+            resp.raise_for_status()
+            self.etag = resp.headers.get('ETag') or self.etag
+            self.last_modified = resp.headers.get('Last-Modified') or self.last_modified
+            self.content_type = resp.headers.get('Content-Type') or self.content_type
+
+            if resp.status_code == 206:
+                match = re.match(r'bytes (\d+)-\d+/(\d+)', resp.headers.get('Content-Range', ''))
+                if not match or int(match.group(1)) != start:
+                    raise IOError(f"Unexpected Content-Range for {self.url}")
+                self.size = int(match.group(2))
+            else:
+                # No range support, or the file changed: everything we had is void
+                self._blocks.clear()
+                length = resp.headers.get('Content-Length')
+                self.size = int(length) if length and length.isdigit() else None
+                start = 0
+
+            with open(self.path, 'r+b') as f:
+                f.seek(start)
+                position = start
+                for chunk in resp.iter_content(64 * 1024):
+                    f.write(chunk)
+                    position += len(chunk)
+                    self.fetched_bytes += len(chunk)
+                    # Blocks become readable as soon as they are complete
+                    done = position // self.block_size
+                    for index in range(start // self.block_size, done):
+                        self._blocks.add(index)
+
+            if self.size is None:
+                self.size = position
+            if position >= self.size and self.size:
+                self._blocks.add(self._block_count() - 1)
+
+    def probe(self, attempts=3):
+        """Learns the file size by fetching the first blocks. Returns the size."""
+        with self._lock:
+            for attempt in range(attempts):
+                if self.size is not None:
+                    break
+                try:
+                    self._fetch(0, self.read_ahead)
+                except Exception as e:
+                    # The size comes with the headers, so a body cut short usually still gives it
+                    if self.size is None and attempt == attempts - 1:
+                        raise
+                    print(f"Stream probe of {self.url} interrupted: {e}")
+            return self.size
+
+    def ensure(self, start, end):
+        """Makes bytes start..end (inclusive) available locally, one request per missing run."""
+        with self._lock:
+            self.probe()
+            if self.size == 0:
+                return
+            last_block = min((end // self.block_size) + self.read_ahead, self._block_count() - 1)
+            index = start // self.block_size
+            while index <= last_block:
+                if index in self._blocks:
+                    index += 1
+                    continue
+                # Each request also covers the read-ahead, so sequential playback isn't one request per block
+                run_limit = min(max(last_block, index + self.read_ahead), self._block_count() - 1)
+                run_end = index
+                while run_end + 1 <= run_limit and run_end + 1 not in self._blocks:
+                    run_end += 1
+                error = None
+                try:
+                    self._fetch(index, run_end)
+                except Exception as e:
+                    # Dropped connection mid-body (ChunkedEncodingError, IncompleteRead, timeouts)
+                    error = e
+                # A short body leaves the tail of the run missing: fetch again from the
+                # first gap, and give up only if a fetch brought nothing new
+                missing = next((i for i in range(index, run_end + 1) if i not in self._blocks), None)
+                if missing == index:
+                    if error is not None:
+                        raise error
+                    raise IOError(f"Could not fetch bytes {index * self.block_size}+ of {self.url}")
+                if error is not None:
+                    print(f"Stream fetch of {self.url} interrupted, continuing at block {missing}: {error}")
+                index = run_end + 1 if missing is None else missing
+
+    def read(self, offset, length):
+        with self._lock:
+            size = self.probe()
+            end = min(offset + length, size) - 1
+            if end < offset:
+                return b''
+            self.ensure(offset, end)
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read(end - offset + 1)
+
+    def contiguous_bytes(self):
+        """How many bytes from the start of the file are present without a gap."""
+        with self._lock:
+            if self.size is None:
+                return 0
+            index = 0
+            while index in self._blocks:
+                index += 1
+            return self.size if index >= self._block_count() else index * self.block_size
+
+    def seed_part(self, part):
+        """
+        Copies the buffered prefix into a download's .part file (plus its sidecar) so the
+        download engine resumes after it. Returns the number of bytes handed over.
+        """
+        with self._lock:
+            length = self.contiguous_bytes()
+            if not length or (os.path.exists(part) and os.path.getsize(part) >= length):
+                return 0
+            os.makedirs(os.path.dirname(part), exist_ok=True)
+            with open(self.path, 'rb') as src, open(part, 'wb') as dst:
+                remaining = length
+                while remaining:
+                    chunk = src.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+            # Same sidecar the download engine writes, so If-Range still protects the resume
+            save_part_meta(part, {'url': self.url, 'etag': self.etag, 'last_modified': self.last_modified})
+            return length - remaining
+
+def _parse_range(value, size):
+    """'bytes=a-b' / 'bytes=a-' / 'bytes=-n' -> (start, end) inclusive, or None for the whole file."""
+    match = re.match(r'bytes=(\d*)-(\d*)', value or '')
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        return max(size - int(match.group(2)), 0), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    return start, min(end, size - 1)
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        key = self.path.lstrip('/').split('/', 1)[0]
+        cache = self.server.streams.get(key)
+        if cache is None:
+            self.send_error(404)
+            return
+        try:
+            size = cache.probe()
+        except Exception as e:
+            print(f"Stream probe failed for {cache.url}: {e}")
+            self.send_error(502)
+            return
+
+        byte_range = _parse_range(self.headers.get('Range'), size)
+        if byte_range and byte_range[0] >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = byte_range or (0, size - 1)
+
+        self.send_response(206 if byte_range else 200)
+        content_type = cache.content_type or mimetypes.guess_type(self.path)[0] or 'application/octet-stream'
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body:
+            return
+
+        position = start
+        try:
+            # Block-sized pieces, so the player gets the first bytes before the rest is fetched
+            while position <= end:
+                data = cache.read(position, min(cache.block_size, end - position + 1))
+                if not data:
+                    break
+                self.wfile.write(data)
+                position += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The player seeked elsewhere and dropped this request
+        except Exception as e:
+            print(f"Stream failed for {cache.url}: {e}")
+
+    def log_message(self, format, *args):
+        pass
+
+class StreamServer:
+    """
+    Local HTTP endpoint that media players can point at: it answers their Range requests
+    from a RangeCache per remote file, fetching from the real server only what's missing.
+    Only the most recent max_streams files are kept.
+    """
+
+    def __init__(self, transport, cache_dir=None, block_size=256 * 1024, read_ahead=2, max_streams=4):
+        self.transport = transport
+        self.cache_dir = cache_dir or data_dir("stream")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.max_streams = max_streams
+        self._streams = OrderedDict() # key -> RangeCache
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _StreamHandler)
+        self._server.daemon_threads = True
+        self._server.streams = self._streams
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stream-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def open(self, url, name=None):
+        """Returns a local URL that streams url."""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        if key in self._streams:
+            self._streams.move_to_end(key)
+        else:
+            path = os.path.join(self.cache_dir, key)
+            self._streams[key] = RangeCache(self.transport, url, path, self.block_size, self.read_ahead)
+            while len(self._streams) > self.max_streams:
+                _, old = self._streams.popitem(last=False)
+                self._remove(old.path)
+        name = name or url.rsplit('/', 1)[-1]
+        port = self._server.server_address[1]
+        # The file name lets players guess the format from the extension
+        return f"http://127.0.0.1:{port}/{key}/{quote(name)}"
+
+    def cache_for(self, url):
+        return self._streams.get(hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._streams.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
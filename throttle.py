@@ -0,0 +1,119 @@
+import threading
+import time
+from contextlib import contextmanager
+
+def parse_rate(text):
+    """'500K', '2M', '1.5m', '300000' -> bytes per second; None / '' / '0' -> None (unlimited)."""
+    if not text:
+        return None
+    text = str(text).strip().upper().rstrip('B')
+    scale = 1
+    if text and text[-1] in 'KMG':
+        scale = 1024 ** ('KMG'.index(text[-1]) + 1)
+        text = text[:-1]
+    rate = int(float(text) * scale)
+    return rate or None
+
+def is_congestion(error):
+    """True for errors that mean the server (or the path to it) is overloaded: 429, 5xx, timeouts."""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return response.status_code == 429 or response.status_code >= 500
+    return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+class TokenBucket:
+    """
+    Caps throughput at rate bytes/second (bursts up to burst bytes). consume() blocks
+    until the bytes may be sent. A rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst or (rate or 0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, burst=None):
+        """Changes the cap in place; transfers already running pick it up with their next chunk."""
+        with self._lock:
+            self.rate = rate
+            self.burst = burst or (rate or 0)
+            self._tokens = min(self._tokens, self.burst)
+            self._updated = time.monotonic()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going negative reserves the bytes; the caller sleeps off the debt outside the lock
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts AIMD-style: it halves on congestion (429 / 5xx /
+    timeouts, at most once per window) and grows by one slot when throughput over the
+    last window improved while every slot was busy.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, window=2.0):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = max(minimum, min(initial, self.maximum))
+        self.window = window
+        self.active = 0
+        self._cond = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._saturated = False
+        self._last_rate = 0.0
+        self._last_decrease = 0.0
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def record(self, amount):
+        """Counts transferred bytes; called as data arrives."""
+        with self._cond:
+            self._window_bytes += amount
+            self._saturated = self._saturated or self.active >= self.limit
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed < self.window:
+                return
+            rate = self._window_bytes / elapsed
+            # Additive increase, but only if the extra slot could have been used and helped
+            if self._saturated and rate > self._last_rate * 1.05 and self.limit < self.maximum:
+                self.limit += 1
+                self._cond.notify_all()
+            self._last_rate = rate
+            self._window_start = now
+            self._window_bytes = 0
+            self._saturated = False
+
+    def congestion(self):
+        """Multiplicative decrease; a burst of failures from one episode only counts once."""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.window:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit // 2)
+            self._last_rate = 0.0
+            print(f"Congestion: concurrency limit lowered to {self.limit}")
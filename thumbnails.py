@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import Qt, QObject, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from appdata import data_dir
+
+THUMBNAIL_SIZE = 96 # Longest side in pixels; the list shows them smaller, so high-DPI screens stay sharp
+MAX_IMAGE_BYTES = 20 * 1024 * 1024 # Don't pull huge originals just for a thumbnail
+
+class ThumbnailCache:
+    """
+    Downscaled images keyed by URL + ETag: a memory LRU in front of PNG files on disk.
+    The last known ETag of each URL is remembered, so a revisit finds its thumbnail
+    without asking the server. QImage is safe to use from worker threads.
+    """
+
+    def __init__(self, cache_dir=None, max_items=256):
+        self.cache_dir = cache_dir or data_dir("thumbnails")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.max_items = max_items
+        self._memory = OrderedDict() # url -> QImage
+        self._etags = self._load_index() # url -> ETag of the image the thumbnail was made from
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _file_for(self, url, etag):
+        key = hashlib.sha1(f"{url}\n{etag or ''}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def get_memory(self, url):
+        with self._lock:
+            image = self._memory.get(url)
+            if image is not None:
+                self._memory.move_to_end(url)
+            return image
+
+    def _remember(self, url, image):
+        with self._lock:
+            self._memory[url] = image
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def load_disk(self, url):
+        with self._lock:
+            if url not in self._etags:
+                return None
+            etag = self._etags[url]
+        image = QImage(self._file_for(url, etag))
+        if image.isNull():
+            return None
+        self._remember(url, image)
+        return image
+
+    def store(self, url, etag, image):
+        self._remember(url, image)
+        image.save(self._file_for(url, etag), "PNG")
+        with self._lock:
+            old = self._etags.get(url)
+            if url in self._etags and old != etag:
+                # Image changed on the server, its old thumbnail is useless now
+                try:
+                    os.remove(self._file_for(url, old))
+                except OSError:
+                    pass
+            self._etags[url] = etag
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dict(self._etags)
+            self._dirty = False
+        tmp = self.index_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """Decodes image bytes and scales them down once. Returns a null QImage if undecodable."""
+    image = QImage()
+    if not image.loadFromData(data):
+        return image
+    if image.width() > size or image.height() > size:
+        image = image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio,
+                             Qt.TransformationMode.SmoothTransformation)
+    return image
+
+class ThumbnailLoader(QObject):
+    """
+    Produces thumbnails on a small thread pool and reports them with thumbnail_ready,
+    which Qt delivers on the GUI thread. cancel_pending() drops queued work for a list
+    that is no longer shown; URLs requested again are picked up by the queued task.
+    """
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, transport, cache=None, workers=4, parent=None):
+        super().__init__(parent)
+        self.transport = transport
+        self.cache = cache or ThumbnailCache()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self._generation = 0
+        self._inflight = {} # url -> generation that still wants it
+        self._lock = threading.Lock()
+
+    def request(self, url):
+        """Returns the thumbnail at once if it's in memory; otherwise loads it in the background."""
+        image = self.cache.get_memory(url)
+        if image is not None:
+            return image
+        with self._lock:
+            queued = url in self._inflight
+            self._inflight[url] = self._generation
+        if not queued:
+            self._pool.submit(self._load, url)
+        return None
+
+    def cancel_pending(self):
+        with self._lock:
+            self._generation += 1
+
+    def _wanted(self, url):
+        with self._lock:
+            if self._inflight.get(url) == self._generation:
+                return True
+            self._inflight.pop(url, None)
+            return False
+
+    def _load(self, url):
+        if not self._wanted(url):
+            return
+        try:
+            image = self.cache.load_disk(url)
+            if image is None:
+                image = self._fetch(url)
+            if image is not None and not image.isNull():
+                self.thumbnail_ready.emit(url, image)
+        except Exception as e:
+            print(f"Thumbnail failed for {url}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def _fetch(self, url):
+        resp = self.transport.get(url, stream=True)
+        try:
+            resp.raise_for_status()
+            length = resp.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+                return None
+            data = resp.content
+        finally:
+            resp.close()
+        image = make_thumbnail(data)
+        if image.isNull():
+            return None
+        self.cache.store(url, resp.headers.get('ETag'), image)
+        return image
+
+    def shutdown(self):
+        self.cancel_pending()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.cache.flush()
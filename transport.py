@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from retry import RetryPolicy, CircuitBreaker
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+class HttpTransport:
+    """
+    Keep-alive HTTP session shared by the scraper and every worker thread.
+    Transient failures (connection errors, timeouts, 429 / 5xx) are retried per
+    retry_policy, and a per-host circuit breaker fails requests fast once a host is down.
+    """
+
+    def __init__(self, pool_size=16, max_hosts=10, timeout=(10, 30), headers=None, retry_policy=None):
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # pool_connections: how many hosts get their own pool
+        # pool_maxsize: how many sockets each host may keep alive
+        self.adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._foreground = 0 # Fetches the user is waiting on
+        self._bulk = 0 # Batch transfers (downloads) in flight
+        self._breakers = {} # host -> CircuitBreaker
+        self._retries = 0
+
+    def breaker(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker()
+            return self._breakers[host]
+
+    def request(self, method, url, retry=True, cancel=None, on_congestion=None, **kwargs):
+        """
+        Sends a request, retrying transient failures unless retry is False. HTTP errors are
+        returned, not raised. Setting cancel (a threading.Event) ends a retry backoff early:
+        the last error is raised, or the last response returned, without another attempt.
+        on_congestion() is called for every timeout, 429 or 5xx as it happens, retried or not,
+        so a caller's concurrency limiter can back off before the retries are used up.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        breaker = self.breaker(url)
+        attempts = self.retry_policy.attempts if retry else 0
+        attempt = 0
+        while True:
+            breaker.before_request(host)
+            with self._lock:
+                self._requests += 1
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.failure()
+                if on_congestion and isinstance(e, requests.Timeout):
+                    on_congestion()
+                if attempt >= attempts:
+                    raise
+                error, resp = e, None
+                wait = self.retry_policy.delay(attempt)
+                print(f"Retrying {url} in {wait:.1f}s after error: {e}")
+            except Exception:
+                # Anything else still ends a half-open trial, or the circuit would never close
+                breaker.failure()
+                raise
+            else:
+                if resp.status_code >= 500:
+                    breaker.failure()
+                else:
+                    # 429 means the host is up, just busy
+                    breaker.success()
+                if on_congestion and (resp.status_code == 429 or resp.status_code >= 500):
+                    on_congestion()
+                if resp.status_code not in self.retry_policy.RETRY_STATUSES or attempt >= attempts:
+                    return resp
+                wait = self.retry_policy.delay(attempt, resp)
+                if wait is None:
+                    return resp # Server wants us to come back much later; let the caller decide
+                print(f"Retrying {url} in {wait:.1f}s after HTTP {resp.status_code}")
+                resp.close()
+            # Waiting on the event lets a superseded fetch give up (and leave foreground) at once
+            if cancel is not None and cancel.wait(wait):
+                if resp is None:
+                    raise error
+                return resp
+            if cancel is None:
+                time.sleep(wait)
+            with self._lock:
+                self._retries += 1
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    @contextmanager
+    def foreground(self):
+        """Marks a fetch the user is waiting on (an opened note); everything else gives way to it."""
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+
+    @contextmanager
+    def bulk(self):
+        """Marks a batch transfer: background jobs wait for it, but it yields to foreground fetches."""
+        with self._lock:
+            self._bulk += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._bulk -= 1
+
+    def has_foreground(self):
+        with self._lock:
+            return self._foreground > 0
+
+    def is_busy(self):
+        with self._lock:
+            return self._foreground > 0 or self._bulk > 0
+
+    def stats(self):
+        """Returns request / new connection counts so handshake savings can be checked."""
+        connections = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # urllib3 counts every socket it opens and every request it sends per host
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+
+        with self._lock:
+            total = self._requests
+            retries = self._retries
+
+        return {
+            'requests': total,
+            'connections': connections,
+            'reused': max(pool_requests - connections, 0),
+            'retries': retries,
+        }
+
+    def close(self):
+        self.session.close()
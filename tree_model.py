@@ -0,0 +1,212 @@
+import qtawesome as qta
+from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QSortFilterProxyModel
+
+PathRole = Qt.ItemDataRole.UserRole
+
+class PathIndex:
+    """
+    Folder -> children lookup built once from the directory cache.
+    Children are only sorted the first time a folder is asked for.
+    """
+
+    def __init__(self, paths):
+        self._children = {'': {}} # folder path -> {child name: is_folder}
+        self._extensions = {} # folder path -> extensions of every file below it
+        self._sorted = {}
+        for path in paths:
+            parts = path.split('/')
+            ext = file_extension(parts[-1])
+            folder = ''
+            for i, part in enumerate(parts):
+                is_folder = i < len(parts) - 1
+                siblings = self._children.setdefault(folder, {})
+                # A name seen once as a folder stays a folder
+                siblings[part] = siblings.get(part, False) or is_folder
+                self._extensions.setdefault(folder, set()).add(ext)
+                folder = f"{folder}/{part}" if folder else part
+
+    def __len__(self):
+        return sum(len(children) for children in self._children.values())
+
+    def is_folder(self, path):
+        return path in self._children
+
+    def extensions_below(self, folder):
+        """Extensions of all files anywhere under folder, so filters can hide empty folders in O(1)."""
+        return self._extensions.get(folder, set())
+
+    def children(self, folder):
+        """Returns [(name, is_folder)] sorted Folder > MD > Other, then alphabetically."""
+        if folder not in self._sorted:
+            def sort_key(entry):
+                name, is_folder = entry
+                # Priority:
+                # 0: Folder
+                # 1: MD File
+                # 2: Other File
+                type_priority = 2
+                if is_folder:
+                    type_priority = 0
+                elif name.endswith('.md'):
+                    type_priority = 1
+                return (type_priority, name.lower())
+
+            self._sorted[folder] = sorted(self._children.get(folder, {}).items(), key=sort_key)
+        return self._sorted[folder]
+
+def file_extension(name):
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+class _Node:
+    __slots__ = ('name', 'path', 'is_folder', 'parent', 'row', 'children')
+
+    def __init__(self, name, path, is_folder, parent, row):
+        self.name = name
+        self.path = path
+        self.is_folder = is_folder
+        self.parent = parent
+        self.row = row
+        self.children = None # Created on first expand
+
+_icons = None
+
+def _get_icons():
+    # Built once per process instead of once per tree level
+    global _icons
+    if _icons is None:
+        _icons = {
+            'folder': qta.icon('fa5s.folder', color='#FBC02D'),
+            'md': qta.icon('fa5s.file-alt', color='#42A5F5'),
+            'media': qta.icon('fa5s.image', color='#AB47BC'),
+        }
+    return _icons
+
+class VaultTreeModel(QAbstractItemModel):
+    """Tree model over a PathIndex that creates a folder's rows only when the view expands it."""
+
+    def __init__(self, path_index, parent=None):
+        super().__init__(parent)
+        self.path_index = path_index
+        self.root = _Node('', '', True, None, 0)
+        self.icons = _get_icons()
+
+    def _node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def _load(self, node):
+        node.children = [
+            _Node(name, f"{node.path}/{name}" if node.path else name, is_folder, node, row)
+            for row, (name, is_folder) in enumerate(self.path_index.children(node.path))
+        ]
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.children is None or not (0 <= row < len(node.children)) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self._node(parent)
+        if node is self.root and node.children is None:
+            self._load(node)
+        return len(node.children) if node.children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        # Lets the view draw an expand arrow without building the children
+        return self._node(parent).is_folder
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return node.is_folder and node.children is None
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if node.children is not None:
+            return
+        count = len(self.path_index.children(node.path))
+        if count == 0:
+            self._load(node)
+            return
+        self.beginInsertRows(parent, 0, count - 1)
+        self._load(node)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return node.name
+        if role == Qt.ItemDataRole.DecorationRole:
+            if node.is_folder:
+                return self.icons['folder']
+            return self.icons['md'] if node.name.endswith('.md') else self.icons['media']
+        if role == Qt.ItemDataRole.ToolTipRole or role == PathRole:
+            return node.path
+        return None
+
+    def index_for_path(self, path):
+        """Finds (loading folders on the way) the index of a vault path, or an invalid index."""
+        index = QModelIndex()
+        node = self.root
+        if node.children is None:
+            self._load(node)
+        for part in path.split('/'):
+            if node.children is None:
+                self.fetchMore(index)
+            match = next((child for child in node.children if child.name == part), None)
+            if match is None:
+                return QModelIndex()
+            node = match
+            index = self.createIndex(node.row, 0, node)
+        return index
+
+class VaultFilterProxyModel(QSortFilterProxyModel):
+    """
+    Hides rows of a VaultTreeModel without rebuilding it, so toggling a filter
+    keeps the user's expanded folders and selection.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.show_media = True
+        self.extensions = None # None = any extension
+
+    def set_filter(self, show_media=None, extensions=...):
+        if show_media is not None:
+            self.show_media = show_media
+        if extensions is not ...:
+            self.extensions = set(e.lower() for e in extensions) if extensions else None
+        self.invalidateFilter()
+
+    def accepts_extension(self, ext):
+        if not self.show_media and ext != 'md':
+            return False
+        return self.extensions is None or ext in self.extensions
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        if not index.isValid():
+            return True
+        node = index.internalPointer()
+        if node.is_folder:
+            # Keep a folder only if something below it survives the filter
+            return any(self.accepts_extension(ext) for ext in model.path_index.extensions_below(node.path))
+        return self.accepts_extension(file_extension(node.name))
+
+    def index_for_path(self, path):
+        return self.mapFromSource(self.sourceModel().index_for_path(path))
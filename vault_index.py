@@ -0,0 +1,153 @@
+import bisect
+import re
+
+_MD_LINK = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+_WIKILINK = re.compile(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]')
+_MD_MARKS = re.compile(r'[*_`~=]')
+
+def heading_key(text):
+    """
+    Comparable form of a heading: the same for the markdown source ("**粗体** `code`")
+    and the text it renders to ("粗体 code").
+    """
+    text = _WIKILINK.sub(r'\1', text)
+    text = _MD_LINK.sub(r'\1', text)
+    text = _MD_MARKS.sub('', text)
+    return ' '.join(text.split()).lower()
+
+class MetadataIndex:
+    """
+    Tag -> notes and heading -> (note, position) lookups built from the directory
+    cache metadata, so both can be queried without fetching any note.
+    """
+
+    def __init__(self, cache_data):
+        self.tags = {} # '#tag' (lowercased) -> {note path: tag as written}
+        self.headings = [] # (lowercased text, note path, heading, level, line, occurrence)
+        for path, meta in cache_data.items():
+            if not meta:
+                continue
+            for entry in meta.get('tags') or []:
+                tag = entry.get('tag', '')
+                if tag:
+                    self.tags.setdefault(tag.lower(), {})[path] = tag
+            seen = {}
+            for entry in meta.get('headings') or []:
+                heading = entry.get('heading', '')
+                # Same heading text can appear several times in one note ("细节" under two sections)
+                occurrence = seen.get(heading, 0)
+                seen[heading] = occurrence + 1
+                line = entry.get('pos', [0])[0]
+                self.headings.append((heading.lower(), path, heading, entry.get('level', 1), line, occurrence))
+        self._tag_keys = sorted(self.tags)
+
+    def notes_with_tag(self, tag):
+        """
+        Notes carrying tag, its nested tags ("#dp" also finds "#dp/区间") and, while the user
+        is still typing, tags starting with it. Returns {note path: [tags as written]}.
+        """
+        tag = tag.strip().lower()
+        if not tag.startswith('#'):
+            tag = '#' + tag
+        notes = {}
+        start = bisect.bisect_left(self._tag_keys, tag)
+        for key in self._tag_keys[start:]:
+            if not key.startswith(tag):
+                break
+            for path, written in self.tags[key].items():
+                notes.setdefault(path, []).append(written)
+        return notes
+
+    def find_headings(self, text, limit=20):
+        """Headings containing text, exact matches first. Returns [(note path, heading, level, line, occurrence)]."""
+        text = text.strip().lower()
+        if not text:
+            return []
+        exact, partial = [], []
+        for lowered, path, heading, level, line, occurrence in self.headings:
+            if lowered == text:
+                exact.append((path, heading, level, line, occurrence))
+            elif text in lowered:
+                partial.append((path, heading, level, line, occurrence))
+        return (exact + partial)[:limit]
+
+class LinkGraph:
+    """
+    Forward links, backlinks and unresolved links between notes, built from the
+    'links' metadata in the directory cache and resolved with the scraper's resolver.
+    """
+
+    def __init__(self, cache_data, resolve):
+        self.forward = {} # note -> [linked vault paths], in document order
+        self.backlinks = {} # vault path -> [notes linking to it]
+        self.unresolved = {} # note -> [link text that matches no vault path]
+        for path, meta in cache_data.items():
+            if not meta or not meta.get('links'):
+                continue
+            targets = []
+            for entry in meta['links']:
+                link = entry.get('link', '')
+                if not link.split('|', 1)[0].split('#', 1)[0].strip():
+                    # Anchor within the same note ("[[#基础教程]]"), not a link to another one
+                    continue
+                target = resolve(link, path)
+                if target is None:
+                    self.unresolved.setdefault(path, []).append(link)
+                elif target != path and target not in targets:
+                    targets.append(target)
+            if targets:
+                self.forward[path] = targets
+                for target in targets:
+                    self.backlinks.setdefault(target, []).append(path)
+        for sources in self.backlinks.values():
+            sources.sort()
+
+    def links_from(self, path):
+        return self.forward.get(path, [])
+
+    def backlinks_to(self, path):
+        return self.backlinks.get(path, [])
+
+    def unresolved_from(self, path):
+        return self.unresolved.get(path, [])
+
+    def closure(self, starts, depth=1):
+        """
+        Breadth-first walk along forward links from starts, up to depth hops
+        (None = unlimited). Returns the notes in visiting order, starts first.
+        """
+        if isinstance(starts, str):
+            starts = [starts]
+        order = list(dict.fromkeys(starts))
+        seen = set(order)
+        frontier = order
+        hops = 0
+        while frontier and (depth is None or hops < depth):
+            next_frontier = []
+            for path in frontier:
+                for target in self.forward.get(path, []):
+                    if target not in seen:
+                        seen.add(target)
+                        next_frontier.append(target)
+            order.extend(next_frontier)
+            frontier = next_frontier
+            hops += 1
+        return order
+
+    def crawl_order(self, paths):
+        """
+        Orders paths so that well-linked hub notes come first and each note is followed
+        by the notes it links to, so a crawl fills the most-referenced content early.
+        """
+        paths = set(paths)
+        roots = sorted(paths, key=lambda p: (-len(self.backlinks.get(p, [])), p))
+        order = []
+        seen = set()
+        for root in roots:
+            if root in seen:
+                continue
+            for path in self.closure(root, depth=None):
+                if path in paths and path not in seen:
+                    seen.add(path)
+                    order.append(path)
+        return order